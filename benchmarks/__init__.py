@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Performance benchmarks; run from the repository root, e.g. python -m benchmarks.run."""
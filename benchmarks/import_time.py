@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Cold-start import cost of the app, measured with python -X importtime.
+
+    python benchmarks/import_time.py [--repeat 5] [--top 15]
+
+"eager" imports every dependency up front, as budgetbox.py did before imports were made
+lazy; "startup" imports only what the app needs before a file is uploaded; the other
+scenarios are the stages that now load their dependencies on first use.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "eager": "import requests, camelot, pdfplumber, fitz, PIL.Image, reportlab.platypus; import proposal_transformer.render",
+    "startup": "import proposal_transformer, proposal_transformer.backends, proposal_transformer.cache, proposal_transformer.parallel",
+    "extract (pymupdf)": "import fitz",
+    "extract (pdfplumber)": "import pdfplumber, fitz",
+    "page-1 lattice": "import camelot",
+    "render": "import proposal_transformer.render",
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(statement):
+    """Returns (total seconds, {module: cumulative seconds}) for one cold interpreter."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    cumulative = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if not m:
+            continue
+        cumulative_us, indent, module = int(m.group(2)), len(m.group(3)), m.group(4)
+        cumulative[module] = cumulative_us / 1e6
+        if indent == 1: # Top-level imports; nested ones are included in their parent's cumulative time
+            total_us += cumulative_us
+    return total_us / 1e6, cumulative
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules listed per scenario")
+    parser.add_argument("scenarios", nargs="*", help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    for name in args.scenarios or SCENARIOS:
+        try:
+            runs = [measure(SCENARIOS[name]) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:<22} failed: {e}")
+            continue
+        totals = [total for total, _ in runs]
+        print(f"{name:<22} median {statistics.median(totals) * 1000:8.1f} ms   min {min(totals) * 1000:8.1f} ms")
+        slowest = sorted(runs[-1][1].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for module, seconds in slowest:
+            print(f"    {seconds * 1000:8.1f} ms  {module}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Peak resident memory of a whole conversion as the page count grows.
+
+    python -m benchmarks.memory                          # in-memory vs streaming, synthetic proposals
+    python -m benchmarks.memory --narrative-pages 0 50 200 --backend pymupdf
+
+Each case converts one synthetic proposal in a fresh child process and reports the
+child's peak RSS (ru_maxrss), so imports and earlier cases do not blur the numbers.
+"bytes" reads the PDF into memory and renders to bytes; "streaming" passes file paths
+to extract() and render(). Narrative pages add page count without adding table rows,
+so a flat streaming column means memory no longer grows with the pages themselves.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import build_proposal
+from proposal_transformer.backends import BACKENDS, DEFAULT_BACKEND
+from proposal_transformer.parallel import count_pages
+
+MODES = ("bytes", "streaming")
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB elsewhere
+
+
+def convert_once(input_path, output_path, mode, backend):
+    from proposal_transformer.pipeline import extract, render
+
+    if mode == "streaming":
+        render(extract(input_path, backend=backend), output_path=output_path)
+    else:
+        with open(input_path, "rb") as f:
+            pdf_bytes = f.read()
+        output_pdf_bytes = render(extract(pdf_bytes, backend=backend))
+        with open(output_path, "wb") as f:
+            f.write(output_pdf_bytes)
+    return peak_rss_mb()
+
+
+def measure(input_path, mode, backend):
+    """Peak RSS in MB of one conversion in a child process."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.memory", "--child", input_path, os.path.join(tmp_dir, "out.pdf"), mode, "--backend", backend],
+            check=True, capture_output=True, text=True,
+        ).stdout
+    return float(output.split()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--narrative-pages", type=int, nargs="+", default=[0, 25, 100])
+    parser.add_argument("--tables", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=40, help="rows per table")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--child", nargs=3, metavar=("INPUT", "OUTPUT", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        input_path, output_path, mode = args.child
+        print(f"{convert_once(input_path, output_path, mode, args.backend):.1f}")
+        return 0
+
+    print(f"{'pages':>6}  " + "  ".join(f"{mode:>12}" for mode in MODES))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for narrative_pages in args.narrative_pages:
+            pdf_bytes, _ = build_proposal(tables=args.tables, rows_per_table=args.rows, narrative_pages=narrative_pages)
+            input_path = os.path.join(tmp_dir, f"proposal_{narrative_pages}.pdf")
+            with open(input_path, "wb") as f:
+                f.write(pdf_bytes)
+            page_count = count_pages(input_path)
+            peaks = [measure(input_path, mode, args.backend) for mode in MODES]
+            print(f"{page_count:>6}  " + "  ".join(f"{peak:>9.1f} MB" for peak in peaks))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
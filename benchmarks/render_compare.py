@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Checks that the fast render mode looks like the Paragraph-only mode, page by page.
+
+    python -m benchmarks.render_compare                    # synthetic proposals
+    python -m benchmarks.render_compare proposals/*.pdf --dpi 100
+
+Each proposal is extracted once and rendered in both modes. The pages of both PDFs are
+rasterized with PyMuPDF and compared pixel by pixel. The check fails when the page
+counts differ or when any page differs in more than --max-diff of its pixels. Pixels
+that move by anti-aliasing only are ignored through --tolerance.
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.synthetic import build_proposal
+from proposal_transformer.backends import BACKENDS, DEFAULT_BACKEND
+from proposal_transformer.pipeline import extract
+
+
+def rasterize(pdf_bytes, dpi):
+    import fitz
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return [page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).samples for page in doc]
+
+
+def page_difference(a, b, tolerance):
+    """Fraction of grey pixels that differ by more than tolerance (0-255)."""
+    if len(a) != len(b):
+        return 1.0
+    return sum(1 for x, y in zip(a, b) if abs(x - y) > tolerance) / max(len(a), 1)
+
+
+def compare_modes(model, dpi=72, tolerance=64):
+    """Renders model in both modes; returns (paragraph pages, fast pages, per-page differences, timings)."""
+    from proposal_transformer.render import render_proposal
+
+    timings = {}
+    outputs = {}
+    for mode, fast in (("paragraph", False), ("fast", True)):
+        start = time.perf_counter()
+        outputs[mode] = render_proposal(model.tables_info, model.grand_total, model.proposal_title, fast=fast)
+        timings[mode] = time.perf_counter() - start
+    reference, candidate = rasterize(outputs["paragraph"], dpi), rasterize(outputs["fast"], dpi)
+    differences = [page_difference(a, b, tolerance) for a, b in zip(reference, candidate)]
+    return len(reference), len(candidate), differences, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="proposal PDFs (default: synthetic proposals)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--tolerance", type=int, default=64, help="grey-level difference ignored per pixel")
+    parser.add_argument("--max-diff", type=float, default=0.002, help="allowed fraction of differing pixels per page")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            cases.append((path, f.read()))
+    if not cases:
+        cases = [(f"synthetic {tables}x{rows}", build_proposal(tables=tables, rows_per_table=rows)[0]) for tables, rows in ((1, 10), (4, 40), (2, 300))]
+
+    failed = False
+    for name, pdf_bytes in cases:
+        model = extract(pdf_bytes, backend=args.backend)
+        reference_pages, fast_pages, differences, timings = compare_modes(model, args.dpi, args.tolerance)
+        worst = max(differences, default=0.0)
+        ok = reference_pages == fast_pages and worst <= args.max_diff
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'}  {name}: {reference_pages} vs {fast_pages} pages, worst page differs in {worst:.3%} of pixels, "
+              f"render {timings['paragraph']:.2f}s -> {timings['fast']:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
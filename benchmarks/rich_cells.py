@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Checks rich-cell lookups from the span index against MuPDF's own clipping.
+
+    python -m benchmarks.rich_cells                       # synthetic proposals
+    python -m benchmarks.rich_cells proposals/*.pdf       # real ones
+
+Before PageSpanIndex, every rich cell was read with page.get_text("dict", clip=bbox).
+clip_rich_cell() is that original lookup. Every cell of every table PyMuPDF finds is
+read both ways, as found and nudged by a few points so that its edges cut through text,
+and any difference is reported. benchmarks.run includes this check.
+"""
+import argparse
+import sys
+
+SHIFTS = [(0, 0), (3, 0), (-3, 0), (0, 3), (0, -3), (7, 2.5), (1.3, -4)] # (dx, dy) applied to every cell
+
+from proposal_transformer.rich_text import BOLD_FONT_MARKERS, PageSpanIndex, extract_rich_cell
+
+
+def clip_rich_cell(page, bbox):
+    """The rich cell text of bbox as read before the span index: one clipped get_text per cell."""
+    d = page.get_text("dict", clip=bbox)
+    x0_bbox, y0_bbox, x1_bbox, y1_bbox = bbox
+    spans = [
+        span for block in d.get("blocks", []) if block.get("type") == 0
+        for line in block.get("lines", []) for span in line.get("spans", [])
+        if span["bbox"][0] < x1_bbox and span["bbox"][2] > x0_bbox and span["bbox"][1] < y1_bbox and span["bbox"][3] > y0_bbox
+    ]
+    lines_dict = {}
+    for span in spans:
+        lines_dict.setdefault(round(span["origin"][1], 1), []).append(span)
+    span_text_lines = []
+    for key in sorted(lines_dict):
+        row_spans = sorted(lines_dict[key], key=lambda span: span["origin"][0])
+        line_pieces = []
+        for span_idx, span in enumerate(row_spans):
+            if span_idx > 0 and span["bbox"][0] > row_spans[span_idx - 1]["bbox"][2] + 1.5:
+                line_pieces.append(" ")
+            text_content = span["text"].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            is_bold = any(b_str in span.get("font", "").lower() for b_str in BOLD_FONT_MARKERS) or bool(span["flags"] & 2)
+            line_pieces.append(f"<b>{text_content}</b>" if is_bold else text_content)
+        span_text_lines.append("".join(line_pieces))
+    return "<br/>".join(span_text_lines)
+
+
+def check_rich_cells(pdf_source, limit=10, cells_per_table=None):
+    """Returns a list of cells whose indexed text differs from clip_rich_cell's.
+
+    cells_per_table spreads the check over that many cells of each table instead of all of
+    them; every clipped read costs a get_text of its own, which is what the index replaced.
+    """
+    from proposal_transformer.backends import open_fitz
+
+    problems = []
+    with open_fitz(pdf_source) as doc:
+        for page in doc:
+            index = None
+            for table in page.find_tables(strategy="lines_strict", snap_tolerance=5, join_tolerance=5).tables:
+                index = index or PageSpanIndex(page)
+                cells = [cell for row in table.rows for cell in row.cells if cell is not None]
+                if cells_per_table:
+                    cells = cells[::max(1, len(cells) // cells_per_table)]
+                for bbox in ((x0 + dx, y0 + dy, x1 + dx, y1 + dy) for x0, y0, x1, y1 in cells for dx, dy in SHIFTS):
+                    indexed, clipped = extract_rich_cell(index, bbox), clip_rich_cell(page, bbox)
+                    if indexed != clipped:
+                        problems.append(f"page {page.number + 1} cell {tuple(round(v, 1) for v in bbox)}: {indexed!r} != {clipped!r}")
+                        if len(problems) >= limit:
+                            return problems
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDFs to check instead of the synthetic proposals")
+    args = parser.parse_args(argv)
+
+    if args.pdfs:
+        cases = [(path, path) for path in args.pdfs]
+    else:
+        from benchmarks.synthetic import build_proposal
+
+        cases = [(f"synthetic {tables}x{rows}", build_proposal(tables=tables, rows_per_table=rows)[0])
+                 for tables, rows in [(1, 10), (4, 40), (16, 10)]]
+    failed = False
+    for name, pdf_source in cases:
+        problems = check_rich_cells(pdf_source)
+        print(f"{name}: {'identical' if not problems else f'{len(problems)} difference(s)'}")
+        for problem in problems:
+            failed = True
+            print(f"  {problem}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Stage-level benchmark of the pipeline over a grid of synthetic proposals.
+
+    python -m benchmarks.run                        # run the grid, compare with the baseline
+    python -m benchmarks.run --save-baseline        # record the current numbers as the baseline
+    python -m benchmarks.run --tables 1 8 --rows 10 80 --backend pymupdf
+    python -m benchmarks.run --repeat 1 --outputs-only  # check outputs against the baseline, ignore timings
+
+For every (tables, rows per table) case the synthetic proposal is extracted and rendered
+under a Profiler. Each stage keeps the best wall time over --repeat runs, plus its
+tracemalloc peak. The extracted rows are checked against what the generator wrote, the
+rich cells against MuPDF's own clipping (benchmarks.rich_cells), and a digest of the
+whole extraction is compared with the baseline. A speedup that changes the output
+therefore fails just like a slowdown does.
+
+The committed baseline.json covers the default grid with the default backend, recorded
+with the full dependency set (camelot included). It stores the versions of the
+libraries that shape the output (ENVIRONMENT_PACKAGES, None when not installed), and a
+run in a different environment is not compared with it: a missing camelot or another
+pdfminer changes the digests without any change in this code. Its timings hold only
+on the machine that recorded it, so compare timings against a baseline recorded
+locally, or pass --outputs-only.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from importlib import metadata
+
+from benchmarks.rich_cells import check_rich_cells
+from benchmarks.synthetic import build_proposal, check_extraction
+from proposal_transformer.backends import BACKENDS, DEFAULT_BACKEND
+from proposal_transformer.pipeline import extract, render
+from proposal_transformer.profiling import Profiler
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+NOISE_FLOOR_SECONDS = 0.05 # Stage differences smaller than this are never reported
+RICH_CELLS_PER_TABLE = 12 # Cells per table read both ways by benchmarks.rich_cells
+ENVIRONMENT_PACKAGES = ("PyMuPDF", "pdfplumber", "pdfminer.six", "camelot-py", "reportlab")
+
+
+def environment():
+    """{distribution: version or None} for ENVIRONMENT_PACKAGES."""
+    versions = {}
+    for name in ENVIRONMENT_PACKAGES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def extraction_digest(model):
+    return hashlib.sha256(json.dumps(list(model), sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def run_case(tables, rows, backend, workers, repeat, narrative_pages=0, strict=False):
+    pdf_bytes, expected = build_proposal(tables=tables, rows_per_table=rows, narrative_pages=narrative_pages)
+    best = None
+    for _ in range(repeat):
+        with Profiler() as profiler:
+            start = time.perf_counter()
+            model = extract(pdf_bytes, backend=backend, workers=workers, profiler=profiler, strict=strict)
+            render(model, profiler=profiler)
+            wall = time.perf_counter() - start
+        if best is None or wall < best["wall"]:
+            best = {"wall": wall, "profile": profiler.to_dict(), "model": model}
+    profile = best["profile"]
+    return {
+        "case": f"{tables}x{rows}",
+        "pages": profile["counters"].get("pages", 0),
+        "wall": best["wall"],
+        "stages": {s["stage"]: {"wall": s["wall"], "peak_bytes": s["peak_bytes"]} for s in profile["stages"]},
+        "counters": profile["counters"],
+        "digest": extraction_digest(best["model"]),
+        "problems": check_extraction(best["model"], expected) + check_rich_cells(pdf_bytes, cells_per_table=RICH_CELLS_PER_TABLE),
+    }
+
+
+def compare(results, baseline, threshold, timings=True):
+    """Returns human-readable regressions of results against baseline; timings=False checks digests only."""
+    regressions = []
+    baseline_cases = {case["case"]: case for case in baseline.get("cases", [])}
+    for case in results["cases"]:
+        base = baseline_cases.get(case["case"])
+        if base is None:
+            continue
+        if case["digest"] != base["digest"]:
+            regressions.append(f"{case['case']}: extraction output changed (digest {case['digest'][:12]} != {base['digest'][:12]})")
+        if not timings:
+            continue
+        timings = [("total", case["wall"], base["wall"])] + [
+            (stage, values["wall"], base["stages"][stage]["wall"])
+            for stage, values in case["stages"].items() if stage in base["stages"]
+        ]
+        for stage, now, before in timings:
+            if now - before > NOISE_FLOOR_SECONDS and now > before * (1 + threshold):
+                regressions.append(f"{case['case']}: {stage} {before:.3f}s -> {now:.3f}s (+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 40, 160])
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--narrative-pages", type=int, default=0, help="prose pages appended to every proposal")
+    parser.add_argument("--strict", action="store_true", help="disable page triage")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown per stage (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--outputs-only", action="store_true", help="compare extraction digests with the baseline, not timings")
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {"backend": args.backend, "workers": args.workers, "narrative_pages": args.narrative_pages,
+               "strict": args.strict, "environment": environment(), "cases": []}
+    failed = False
+    for tables in args.tables:
+        for rows in args.rows:
+            case = run_case(tables, rows, args.backend, args.workers, args.repeat, args.narrative_pages, args.strict)
+            results["cases"].append(case)
+            slowest = sorted(case["stages"].items(), key=lambda item: item[1]["wall"], reverse=True)[:3]
+            print(f"{case['case']:>8}  {case['pages']:4d} pages  {case['wall']:7.3f}s  "
+                  + "  ".join(f"{stage} {values['wall']:.3f}s" for stage, values in slowest))
+            for problem in case["problems"]:
+                failed = True
+                print(f"          incorrect: {problem}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        settings = {"backend": None, "workers": None, "narrative_pages": 0, "strict": False} # Older baselines lack the last two
+        recorded = {key: baseline.get(key, default) for key, default in settings.items()}
+        changed = {name: (version, results["environment"].get(name))
+                   for name, version in baseline.get("environment", dict.fromkeys(ENVIRONMENT_PACKAGES)).items()
+                   if version != results["environment"].get(name)}
+        if any(recorded[key] != results[key] for key in settings):
+            print("\nBaseline was recorded with " + " ".join(f"{key}={value}" for key, value in recorded.items()) + "; not comparing.")
+        elif changed:
+            print("\nBaseline was recorded with other libraries ("
+                  + ", ".join(f"{name} {before} -> {now}" for name, (before, now) in changed.items()) + "); not comparing.")
+        else:
+            regressions = compare(results, baseline, args.threshold, timings=not args.outputs_only)
+            print("\nRegressions:" if regressions else "\nNo regressions against the baseline.")
+            for regression in regressions:
+                failed = True
+                print(f"  {regression}")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
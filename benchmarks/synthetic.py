@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Synthetic vertical proposals that look like the real inputs, plus the rows they should yield.
+
+Each proposal is a portrait PDF with ruled tables using the seven HEADERS columns, bold
+spans and hyperlinks in the Description cells, a Subtotal row per table and a
+"Grand Total" line at the end. Tables longer than a page continue on the next page with
+the header repeated, as in vendor proposals. narrative_pages adds that many pages of
+prose (scope, terms, signatures) after the tables, which page triage should skip.
+"""
+import io
+import random
+import re
+from datetime import date
+from decimal import Decimal
+
+CHANNELS = ["Paid Search", "Paid Social", "Display", "Connected TV", "Streaming Audio", "Email", "Geofencing"]
+DETAILS = ["prospecting campaign", "retargeting", "brand awareness flight", "yield campaign", "always-on program"]
+NOTES = ["Includes creative refresh", "Billed monthly", "", "Targeting adult learners", "Pending approval", ""]
+TITLE = "Enrollment Marketing Proposal for Example University"
+PROSE = [
+    "This proposal outlines a multi-channel enrollment strategy built around the university's priority programs.",
+    "Campaign performance is reviewed with the marketing team each month and budgets are rebalanced as needed.",
+    "Creative assets are supplied by the university unless otherwise noted in the scope of work.",
+    "Either party may terminate the agreement with thirty days written notice.",
+]
+
+
+def add_months(start, months):
+    month_index = start.month - 1 + months
+    return date(start.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def money(value):
+    return f"${value:,.2f}"
+
+
+def build_proposal(tables=4, rows_per_table=20, seed=0, link_every=3, narrative_pages=0):
+    """Returns (pdf_bytes, expected) where expected holds the rows, subtotals and grand total."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import LongTable, PageBreak, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+    rng = random.Random(seed)
+    title_style = ParagraphStyle("SynthTitle", fontName="Helvetica-Bold", fontSize=16, leading=20, spaceAfter=12)
+    heading_style = ParagraphStyle("SynthHeading", fontName="Helvetica-Bold", fontSize=11, leading=14, spaceAfter=6)
+    cell_style = ParagraphStyle("SynthCell", fontName="Helvetica", fontSize=7, leading=9)
+    prose_style = ParagraphStyle("SynthProse", fontName="Helvetica", fontSize=10, leading=14, spaceAfter=8)
+    header_labels = ["Description", "Start Date", "End Date", "Term (Months)", "Monthly Amount", "Item Total", "Notes"]
+    col_widths = [w * inch for w in (2.2, 0.75, 0.75, 0.6, 0.9, 0.9, 1.4)]
+
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=letter, leftMargin=0.5 * inch, rightMargin=0.5 * inch,
+                            topMargin=0.5 * inch, bottomMargin=0.5 * inch, title=TITLE)
+    story = [Paragraph(TITLE, title_style)]
+    expected = {"title": TITLE, "rows": [], "subtotals": [], "grand_total": None, "grand_total_amount": None}
+    grand_total = Decimal("0")
+
+    for t_idx in range(tables):
+        story.append(Paragraph(f"Campaign {t_idx + 1}", heading_style))
+        table_rows = [[Paragraph(f"<b>{label}</b>", cell_style) for label in header_labels]]
+        subtotal = Decimal("0")
+        for r_idx in range(rows_per_table):
+            channel = rng.choice(CHANNELS)
+            detail = f"{rng.choice(DETAILS)} {t_idx + 1}.{r_idx + 1}"
+            start = date(2025, rng.randint(1, 12), 1)
+            term = rng.randint(1, 12)
+            end = add_months(start, term)
+            monthly = Decimal(rng.randint(100, 9000)) + Decimal(rng.choice(["0", "0.50", "0.25"]))
+            item_total = monthly * term
+            subtotal += item_total
+            link = f"https://example.com/media/{t_idx + 1}/{r_idx + 1}" if r_idx % link_every == 0 else None
+            description = f"<b>{channel}</b> {detail}"
+            if link:
+                description = f'<a href="{link}">{description}</a>'
+            note = rng.choice(NOTES)
+            table_rows.append([
+                Paragraph(description, cell_style), start.strftime("%m/%d/%Y"), end.strftime("%m/%d/%Y"), str(term),
+                money(monthly), money(item_total), Paragraph(note, cell_style),
+            ])
+            expected["rows"].append({
+                "description": f"{channel} {detail}", "start_date": start.strftime("%m/%d/%Y"),
+                "end_date": end.strftime("%m/%d/%Y"), "term": str(term), "monthly": money(monthly),
+                "item_total": money(item_total), "notes": note, "link": link,
+            })
+        table_rows.append(["Subtotal", "", "", "", "", money(subtotal), ""])
+        expected["subtotals"].append(money(subtotal))
+        grand_total += subtotal
+
+        table = LongTable(table_rows, colWidths=col_widths, repeatRows=1)
+        table.setStyle(TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+            ("FONTNAME", (0, 1), (-1, -1), "Helvetica"), ("FONTSIZE", (0, 1), (-1, -1), 7),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]))
+        story.extend([table, Spacer(1, 18)])
+
+    expected["grand_total"] = money(grand_total)
+    expected["grand_total_amount"] = grand_total
+    story.append(Paragraph(f"<b>Grand Total: {money(grand_total)}</b>", heading_style))
+    for n_idx in range(narrative_pages):
+        story.extend([PageBreak(), Paragraph(f"Section {n_idx + 1}: Scope and Terms", heading_style)])
+        story.extend(Paragraph(" ".join(rng.sample(PROSE, len(PROSE))), prose_style) for _ in range(12))
+    doc.build(story)
+    return buf.getvalue(), expected
+
+
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def squash(text):
+    """Plain text without markup or any whitespace, so wrapped and unwrapped cells compare equal."""
+    text = TAG_RE.sub("", text or "").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+    return re.sub(r"\s+", "", text)
+
+
+def check_extraction(model, expected, limit=10):
+    """Compares an ExtractedProposal against build_proposal's expectations; returns a list of problems."""
+    problems = []
+    rows = [(row, link) for _, table_rows, links, _ in model.tables_info for row, link in zip(table_rows, links)]
+    if len(rows) != len(expected["rows"]):
+        problems.append(f"extracted {len(rows)} rows, expected {len(expected['rows'])}")
+    for r_idx, ((row, link), want) in enumerate(zip(rows, expected["rows"])):
+        got = {
+            "description": squash(row[0]), "start_date": row[1], "end_date": row[2], "term": row[3],
+            "monthly": row[4], "item_total": row[5],
+        }
+        for key, value in got.items():
+            want_value = squash(want[key]) if key == "description" else want[key]
+            if value != want_value:
+                problems.append(f"row {r_idx}: {key} {value!r} != {want_value!r}")
+        if link is not None and link != want["link"]: # Page-1 camelot rows legitimately carry no links
+            problems.append(f"row {r_idx}: link {link!r} != {want['link']!r}")
+        if len(problems) >= limit:
+            break
+    if model.grand_total != expected["grand_total"]:
+        problems.append(f"grand total {model.grand_total!r} != {expected['grand_total']!r}")
+    if squash(model.proposal_title) != squash(expected["title"]): # Layout text may pad the spaces
+        problems.append(f"title {model.proposal_title!r} != {expected['title']!r}")
+    problems.extend( # validate()'s subtotal checks depend on find_total's attribution, so they are checked directly below
+        f"line items: row {d.row} of table {d.table} {d.expected} != {d.actual}"
+        for d in model.line_items.validate() if d.check == "monthly_x_term"
+    )
+    row_subtotals = [cell for _, _, _, total in model.tables_info if isinstance(total, list) for cell in total if cell.startswith("$")]
+    if row_subtotals != expected["subtotals"]:
+        problems.append(f"subtotal rows {row_subtotals} != {expected['subtotals']}")
+    if model.line_items.grand_total != expected["grand_total_amount"]:
+        problems.append(f"line items: Grand Total {model.line_items.grand_total} != {expected['grand_total_amount']}")
+    items_sum = sum(item.item_total or 0 for item in model.line_items.items)
+    if items_sum != expected["grand_total_amount"]:
+        problems.append(f"line items: Item Totals sum to {items_sum}, Grand Total is {expected['grand_total_amount']}")
+    return problems
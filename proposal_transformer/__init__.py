@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""Reusable pieces of the proposal layout transformer behind budgetbox.py.
+
+    from proposal_transformer import extract, render
+    model = extract(pdf_bytes)
+    pdf_out = render(model)
+    csv_text = model.line_items.to_csv()
+"""
+from proposal_transformer.extract import ExtractedProposal
+from proposal_transformer.jobs import JobCancelled, JobQueue
+from proposal_transformer.layout import RenderOptions
+from proposal_transformer.line_items import LineItem, ProposalLineItems
+from proposal_transformer.pipeline import NothingToReformatError, convert, extract, render
+
+__all__ = [
+    "ExtractedProposal", "JobCancelled", "JobQueue", "LineItem", "NothingToReformatError", "ProposalLineItems",
+    "RenderOptions", "convert", "extract", "render",
+]
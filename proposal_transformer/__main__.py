@@ -0,0 +1,5 @@
+import sys
+
+from proposal_transformer.cli import main
+
+sys.exit(main())
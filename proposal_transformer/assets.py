@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""The header logo as a configurable, locally cached asset.
+
+BUDGETBOX_LOGO is a file path or URL (default: the Carnegie logo). A file at
+proposal_transformer/assets/logo.png, installed with the package, is used when
+BUDGETBOX_LOGO is not set. URLs are fetched at most once per process, in the
+background, and kept in an on-disk cache (BUDGETBOX_ASSET_CACHE_DIR) that is
+revalidated with its ETag once older than BUDGETBOX_LOGO_TTL seconds. get_logo()
+never touches the network itself.
+
+A conversion rendered while the logo was unavailable is cached with logo_missing set
+(jobs.py), and budgetbox.py renders the cached model again once the logo has loaded.
+cli.py writes such an output but leaves it out of date, so the next run redoes it.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+DEFAULT_LOGO_URL = "https://www.carnegiehighered.com/wp-content/uploads/2021/11/Twitter-Image-2-2021.png"
+BUNDLED_LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "logo.png")
+ASSET_CACHE_DIR = os.environ.get("BUDGETBOX_ASSET_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "budgetbox")
+LOGO_TTL_SECONDS = int(os.environ.get("BUDGETBOX_LOGO_TTL", str(7 * 24 * 3600)))
+LOGO_FETCH_TIMEOUT = 15
+LOGO_RETRY_SECONDS = 300 # After a failed load, wait this long before trying again
+
+
+class LogoAsset:
+    """Logo bytes decoded once; ReportLab sizes are computed once per requested width."""
+
+    def __init__(self, data):
+        from PIL import Image
+
+        self.data = data
+        with Image.open(io.BytesIO(data)) as pil_img:
+            pil_img.load() # Decode now so corrupt files fail here, not during doc.build
+            self.width, self.height = pil_img.size
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError("logo image has no size")
+        self._sizes = {}
+
+    def reportlab_size(self, width):
+        if width not in self._sizes:
+            self._sizes[width] = (width, width * self.height / self.width)
+        return self._sizes[width]
+
+
+def logo_source():
+    configured = os.environ.get("BUDGETBOX_LOGO")
+    if configured:
+        return configured
+    return BUNDLED_LOGO_PATH if os.path.exists(BUNDLED_LOGO_PATH) else DEFAULT_LOGO_URL
+
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+# --- On-disk cache ---
+def _cache_paths(url):
+    stem = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(ASSET_CACHE_DIR, f"logo-{stem}.img"), os.path.join(ASSET_CACHE_DIR, f"logo-{stem}.json")
+
+
+def _read_cached(url):
+    """Returns (bytes, metadata) from the disk cache, or (None, {})."""
+    data_path, meta_path = _cache_paths(url)
+    try:
+        with open(data_path, "rb") as f:
+            data = f.read()
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return data, meta
+    except (OSError, ValueError):
+        return None, {}
+
+
+def _write_cached(url, data, meta):
+    data_path, meta_path = _cache_paths(url)
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        if data is not None:
+            with open(data_path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(data_path + ".tmp", data_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+    except OSError:
+        pass # A read-only cache only costs a refetch in the next process
+
+
+def fetch_logo(url, timeout=LOGO_FETCH_TIMEOUT):
+    """Downloads url (conditionally, when a cached copy has an ETag) and returns the current bytes."""
+    import requests
+
+    cached_data, meta = _read_cached(url)
+    headers = {"If-None-Match": meta["etag"]} if cached_data is not None and meta.get("etag") else {}
+    resp = requests.get(url, timeout=timeout, headers=headers)
+    if resp.status_code == 304:
+        meta["fetched_at"] = time.time()
+        _write_cached(url, None, meta)
+        return cached_data
+    resp.raise_for_status()
+    _write_cached(url, resp.content, {"etag": resp.headers.get("ETag"), "fetched_at": time.time()})
+    return resp.content
+
+
+# --- Process-wide logo ---
+_logo_lock = threading.Lock()
+_logo = None
+_logo_error = None
+_fetch_thread = None
+_last_attempt = 0.0
+
+
+def _set_logo(data):
+    global _logo, _logo_error
+    try:
+        _logo, _logo_error = LogoAsset(data), None
+    except Exception as e:
+        _logo_error = f"Could not process logo: {e}"
+
+
+def _fetch_in_background(url):
+    global _logo_error, _fetch_thread
+    try:
+        data = fetch_logo(url)
+        with _logo_lock:
+            _set_logo(data)
+    except Exception as e:
+        with _logo_lock:
+            if _logo is None:
+                _logo_error = f"Could not download logo from URL: {e}"
+    finally:
+        with _logo_lock:
+            _fetch_thread = None
+
+
+def _start_fetch(url):
+    global _fetch_thread
+    if _fetch_thread is None:
+        _fetch_thread = threading.Thread(target=_fetch_in_background, args=(url,), name="budgetbox-logo-fetch", daemon=True)
+        _fetch_thread.start()
+
+
+def get_logo(wait=False):
+    """Returns the LogoAsset, or None while it is unavailable (see logo_error()).
+
+    Without wait, only local files and the disk cache are read; a missing or expired
+    download is started in the background. With wait, that download is waited for.
+    """
+    global _logo_error, _last_attempt
+    with _logo_lock:
+        if _logo is None and _fetch_thread is None and time.time() - _last_attempt > LOGO_RETRY_SECONDS:
+            _last_attempt = time.time()
+            source = logo_source()
+            if not is_url(source):
+                try:
+                    with open(source, "rb") as f:
+                        _set_logo(f.read())
+                except OSError as e:
+                    _logo_error = f"Could not read logo file {source}: {e}"
+            else:
+                cached_data, meta = _read_cached(source)
+                if cached_data is not None:
+                    _set_logo(cached_data)
+                if cached_data is None or time.time() - meta.get("fetched_at", 0) > LOGO_TTL_SECONDS:
+                    _start_fetch(source)
+        fetch_thread = _fetch_thread
+    if wait and fetch_thread is not None:
+        fetch_thread.join(LOGO_FETCH_TIMEOUT + 5)
+    return _logo
+
+
+def logo_error():
+    return _logo_error
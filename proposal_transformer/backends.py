@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Extraction backends: everything the table logic needs from a PDF, behind one interface.
+
+A backend yields one PageContent per page in page order and answers rich-cell lookups
+for cell bboxes it reported. Table rows come with the bbox of each cell (None where a
+cell is merged or unknown); camelot tables carry no bboxes at all. Unless strict, pages
+that triage.py judges table-free skip table detection and come back with text only.
+
+camelot, pdfplumber and fitz are imported by the methods that use them, so importing
+this module (and starting the app) does not pay for OpenCV, ghostscript or pdfminer.
+
+The PDF is either bytes or a file path. Every parser opens a path directly, so a
+spooled upload is never copied into memory. Per-page parser state (pdfplumber layout
+caches, span indexes) is released once the consumer has processed each page.
+"""
+import io
+import os
+from collections import namedtuple
+
+from proposal_transformer.profiling import NULL_PROFILER
+from proposal_transformer.rich_text import PageSpanIndex, extract_rich_cell
+
+PageContent = namedtuple("PageContent", "index text tables links")
+PageTable = namedtuple("PageTable", "source data cell_rows")
+
+TABLE_HEADER_KEYWORDS = ['description', 'date', 'term', 'amount', 'total', 'notes']
+
+
+class ExtractionBackend:
+    """Base class; subclasses implement pages() and may reuse the fitz span index below."""
+
+    name = None
+
+    def __init__(self, pdf_source, profiler=NULL_PROFILER, strict=False):
+        self.pdf_source = pdf_source # bytes or a file path
+        self.profiler = profiler
+        self.strict = strict
+        self._triage = {} # page_index -> PageTriage
+        self._doc_fitz = None
+        self._span_indexes = {} # page_index -> PageSpanIndex, built on first lookup
+
+    def pages(self, page_numbers=None):
+        """Yields PageContent for page_numbers (0-based, ascending), or for every page when None."""
+        raise NotImplementedError
+
+    @property
+    def page_count(self):
+        return self.doc_fitz.page_count
+
+    def open_source(self):
+        """A path or file object for parsers that accept either."""
+        return self.pdf_source if is_pdf_path(self.pdf_source) else io.BytesIO(self.pdf_source)
+
+    def release_page(self, page_index):
+        self._span_indexes.pop(page_index, None)
+
+    def needs_table_detection(self, page_index, page=None):
+        """False when triage finds no sign of a pricing table; always True in strict mode."""
+        if self.strict:
+            return True
+        if page_index not in self._triage:
+            from proposal_transformer.triage import triage_page
+
+            with self.profiler.stage("triage", page=page_index):
+                self._triage[page_index] = triage_page(page if page is not None else self.doc_fitz.load_page(page_index))
+            if not self._triage[page_index].likely_table:
+                self.profiler.count("pages_skipped_by_triage")
+        return self._triage[page_index].likely_table
+
+    def rich_cell(self, page_index, bbox):
+        self.profiler.count("rich_cell_calls")
+        try:
+            if page_index not in self._span_indexes:
+                with self.profiler.stage("span_index", page=page_index):
+                    self._span_indexes[page_index] = PageSpanIndex(self.doc_fitz.load_page(page_index))
+        except Exception:
+            return ""
+        with self.profiler.stage("rich_cell", page=page_index):
+            return extract_rich_cell(self._span_indexes[page_index], bbox)
+
+    @property
+    def doc_fitz(self):
+        if self._doc_fitz is None:
+            try:
+                self._doc_fitz = open_fitz(self.pdf_source)
+            except Exception as e:
+                raise ValueError(f"Error opening PDF with Fitz: {e}") from e
+        return self._doc_fitz
+
+    def close(self):
+        if self._doc_fitz is not None:
+            self._doc_fitz.close()
+            self._doc_fitz = None
+        self._span_indexes.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PlumberBackend(ExtractionBackend):
+    """camelot lattice for the tables of page 1, pdfplumber for text, tables and hyperlinks, fitz for rich cells."""
+
+    name = "pdfplumber"
+
+    def read_first_page_tables(self):
+        """Rows of every pricing table camelot finds on page 1, top to bottom."""
+        import camelot # A required dependency of this backend; a missing install must not pass for "no table"
+
+        first_page_tables = []
+        try:
+            tables_camelot = camelot.read_pdf(self.open_source(), pages="1", flavor="lattice", strip_text="\n", line_scale=40)
+            for table_camelot in tables_camelot:
+                raw = table_camelot.df.values.tolist()
+                if len(raw) > 1 and len(raw[0]) >= 6: # Basic check for table validity
+                    header_row_text = "".join([str(h).lower() for h in raw[0]])
+                    if any(kw in header_row_text for kw in TABLE_HEADER_KEYWORDS):
+                        first_page_tables.append(raw)
+        except Exception: # Broad except for Camelot, as it can have various issues
+            pass
+        return first_page_tables
+
+    def pages(self, page_numbers=None):
+        import pdfplumber
+
+        self.doc_fitz # Fail early, as before, when fitz cannot open the document
+        first_page_tables = []
+        if (page_numbers is None or 0 in page_numbers) and self.needs_table_detection(0):
+            with self.profiler.stage("camelot_lattice", page=0):
+                first_page_tables = self.read_first_page_tables()
+        with pdfplumber.open(self.open_source()) as pdf:
+            selected_pages = pdf.pages if page_numbers is None else [pdf.pages[i] for i in page_numbers]
+            for page in selected_pages:
+                page_index = page.page_number - 1
+                yield from self._plumber_page(page, page_index, first_page_tables)
+                page.close() # Drop pdfplumber's per-page layout and object caches
+                self.release_page(page_index)
+
+    def _plumber_page(self, page, page_index, first_page_tables):
+        with self.profiler.stage("page_text", page=page_index):
+            text = page.extract_text(x_tolerance=1, y_tolerance=1, layout=True) or ""
+        if page_index == 0 and first_page_tables:
+            yield PageContent(page_index, text, [PageTable("camelot", raw, None) for raw in first_page_tables], [])
+            return
+        if not self.needs_table_detection(page_index):
+            yield PageContent(page_index, text, [], [])
+            return
+
+        with self.profiler.stage("find_tables", page=page_index):
+            table_settings = {
+                "vertical_strategy": "lines_strict", "horizontal_strategy": "lines_strict",
+                "explicit_vertical_lines": page.curves + page.edges,
+                "explicit_horizontal_lines": page.curves + page.edges,
+                "snap_tolerance": 5, "join_tolerance": 5,
+                "min_words_vertical": 2, "min_words_horizontal": 1
+            }
+            current_page_tables = page.find_tables(table_settings=table_settings)
+            if not current_page_tables: current_page_tables = page.find_tables() # Fallback
+        with self.profiler.stage("table_extract", page=page_index):
+            tables = [
+                PageTable("pdfplumber", tbl.extract(x_tolerance=1, y_tolerance=1), [row.cells for row in tbl.rows])
+                for tbl in current_page_tables
+            ]
+        with self.profiler.stage("hyperlinks", page=page_index):
+            links = page.hyperlinks
+        yield PageContent(page_index, text, tables, links)
+
+
+class FitzBackend(ExtractionBackend):
+    """PyMuPDF only: tables, links, text and spans all come from one load of each page."""
+
+    name = "pymupdf"
+
+    def pages(self, page_numbers=None):
+        for page_index in range(self.page_count) if page_numbers is None else page_numbers:
+            page = self.doc_fitz.load_page(page_index)
+            if not self.needs_table_detection(page_index, page):
+                with self.profiler.stage("page_text", page=page_index):
+                    text = self.page_text(page)
+                yield PageContent(page_index, text, [], [])
+                continue
+            with self.profiler.stage("find_tables", page=page_index):
+                current_page_tables = page.find_tables(strategy="lines_strict", snap_tolerance=5, join_tolerance=5)
+                if not current_page_tables.tables: current_page_tables = page.find_tables() # Fallback
+            with self.profiler.stage("table_extract", page=page_index):
+                tables = [
+                    PageTable("pymupdf", tbl.extract(), [row.cells for row in tbl.rows])
+                    for tbl in current_page_tables.tables
+                ]
+            if tables: # Index spans while the page is loaded; rich cells are only needed for table pages
+                with self.profiler.stage("span_index", page=page_index):
+                    self._span_indexes[page_index] = PageSpanIndex(page)
+            with self.profiler.stage("hyperlinks", page=page_index):
+                links = [
+                    {"x0": link["from"].x0, "x1": link["from"].x1, "top": link["from"].y0, "bottom": link["from"].y1, "uri": link["uri"]}
+                    for link in page.get_links() if link.get("uri")
+                ]
+            with self.profiler.stage("page_text", page=page_index):
+                text = self.page_text(page)
+            yield PageContent(page_index, text, tables, links)
+            self.release_page(page_index)
+
+    @staticmethod
+    def page_text(page):
+        # Rebuild visual lines from words so "Total ... $1,234.00" stays on one line, like pdfplumber's layout text
+        lines = []
+        for x0, y0, x1, y1, word, *_ in sorted(page.get_text("words"), key=lambda w: w[3]):
+            if lines and y1 - lines[-1][0] <= 2:
+                lines[-1][1].append((x0, word))
+            else:
+                lines.append((y1, [(x0, word)]))
+        return "\n".join(" ".join(word for _, word in sorted(words)) for _, words in lines)
+
+
+BACKENDS = {backend.name: backend for backend in (PlumberBackend, FitzBackend)}
+DEFAULT_BACKEND = PlumberBackend.name
+
+
+def is_pdf_path(pdf_source):
+    return isinstance(pdf_source, (str, os.PathLike))
+
+
+def open_fitz(pdf_source):
+    import fitz
+
+    return fitz.open(pdf_source) if is_pdf_path(pdf_source) else fitz.open(stream=pdf_source, filetype="pdf")
+
+
+def open_backend(name, pdf_source, profiler=NULL_PROFILER, strict=False):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend {name!r}; choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](pdf_source, profiler=profiler, strict=strict)
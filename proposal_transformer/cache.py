@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed result cache keyed on the SHA-256 of the uploaded PDF.
+
+result_key() adds everything else that changes a result: the backend, strict mode,
+the column mappings in effect (BUDGETBOX_COLUMN_MAPPINGS) and RESULT_SCHEMA_VERSION.
+
+Entries live in an in-memory LRU tier and, when a directory is configured, in an
+on-disk tier that survives restarts. Both tiers evict least recently used entries
+once their size budget is exceeded.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+RESULT_SCHEMA_VERSION = 1 # Bump when extraction or the cached result dict changes, so old entries miss
+
+
+def content_key(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def file_content_key(path, chunk_bytes=1024 * 1024):
+    """content_key of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_key(source_key, backend, strict=False):
+    """Key of a conversion's result, shared by the result cache and the job queue."""
+    from proposal_transformer.columns import load_synonyms
+
+    mappings = hashlib.sha256(json.dumps(load_synonyms(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{source_key}-{backend}{'-strict' if strict else ''}-v{RESULT_SCHEMA_VERSION}-{mappings}"
+
+
+class ResultCache:
+    def __init__(self, memory_limit_bytes=256 * 1024 * 1024, disk_dir=None, disk_limit_bytes=2 * 1024 * 1024 * 1024):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.disk_dir = disk_dir
+        self.disk_limit_bytes = disk_limit_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._entries = OrderedDict() # key -> (value, size in bytes)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._entries[key][0]
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+        self._memory_put(key, value, len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        return value
+
+    def put(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._memory_put(key, value, len(payload))
+        self._disk_put(key, payload)
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._entries), memory_bytes=self._memory_bytes)
+
+    # --- Memory tier ---
+    def _memory_put(self, key, value, size):
+        if size > self.memory_limit_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    # --- Disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path) # Mark as recently used for eviction
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception: # Corrupt or unreadable entry, drop it
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _disk_put(self, key, payload):
+        if not self.disk_dir or len(payload) > self.disk_limit_bytes:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+            self._disk_evict()
+        except OSError:
+            pass # The disk tier is best effort
+
+    def _disk_evict(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                st_info = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((st_info.st_mtime, st_info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_limit_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+                total -= size
+            except OSError:
+                pass
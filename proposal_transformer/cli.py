@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Batch conversion of proposal PDFs.
+
+    budgetbox proposals/ "archive/2024-*/*.pdf" -o transformed/ --jobs 8
+
+Inputs may be files, directories (every *.pdf inside) or glob patterns. An input is
+skipped when its output (and every --export file) exists and is newer than the input,
+unless --force is given. An output rendered while the logo could not be loaded is
+written with a warning and left older than its input, so the next run renders it
+again; --no-logo leaves the logo out on purpose.
+--export csv|json|xlsx also writes the parsed line items next to each output, and
+any validation discrepancy (Monthly x Term, subtotals, Grand Total) is reported.
+Inputs are read from disk by the parsers and outputs are rendered straight to disk
+(streaming mode), so a worker never holds a whole input or output PDF in memory.
+Scanned pages are OCR'd when pytesseract and Tesseract are installed (see ocr.py).
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from proposal_transformer.assets import get_logo
+from proposal_transformer.backends import BACKENDS, DEFAULT_BACKEND
+from proposal_transformer.parallel import count_pages, default_workers
+
+OUTPUT_SUFFIX = "_transformed.pdf"
+LINE_ITEMS_SUFFIX = "_line_items"
+EXPORT_FORMATS = ("csv", "json", "xlsx")
+
+
+def collect_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.pdf")) + glob.glob(os.path.join(pattern, "*.PDF"))
+        else:
+            matches = glob.glob(pattern) or ([pattern] if os.path.isfile(pattern) else [])
+        paths.extend(sorted(m for m in matches if not m.endswith(OUTPUT_SUFFIX)))
+    return list(dict.fromkeys(paths)) # Drop duplicates, keep order
+
+
+def output_path_for(input_path, output_dir):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, stem + OUTPUT_SUFFIX)
+
+
+def plan_outputs(inputs, output_dir):
+    """(input_path, output_path) pairs, and (input_path, other_input) for inputs whose
+    output name is already taken by an earlier input (e.g. a/q.pdf and b/q.pdf)."""
+    planned, collisions, owners = [], [], {}
+    for input_path in inputs:
+        output_path = output_path_for(input_path, output_dir)
+        owner = owners.setdefault(os.path.normcase(output_path), input_path)
+        if owner == input_path:
+            planned.append((input_path, output_path))
+        else:
+            collisions.append((input_path, owner))
+    return planned, collisions
+
+
+def export_path_for(output_path, fmt):
+    return output_path[:-len(OUTPUT_SUFFIX)] + f"{LINE_ITEMS_SUFFIX}.{fmt}"
+
+
+def is_up_to_date(input_path, output_path, exports=()):
+    """True when the output and every requested export exist and are newer than the input."""
+    input_mtime = os.path.getmtime(input_path)
+    return all(os.path.exists(path) and os.path.getmtime(path) >= input_mtime
+               for path in [output_path] + [export_path_for(output_path, fmt) for fmt in exports])
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def convert_file(input_path, output_path, backend, page_workers, strict=False, exports=(), logo=True):
+    """Converts one file; returns (pages, warnings). Runs in a worker process.
+    logo=False renders without the logo instead of the configured one."""
+    from proposal_transformer.layout import RenderOptions
+    from proposal_transformer.pipeline import ensure_reformattable, extract, render
+
+    logo_missing = logo and get_logo(wait=True) is None
+    warnings = []
+    model = ensure_reformattable(extract(input_path, backend=backend, workers=page_workers, strict=strict))
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        render(model, on_warning=warnings.append, output_path=tmp_path, options=None if logo else RenderOptions(logo=b""))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    for fmt in exports:
+        write_atomic(export_path_for(output_path, fmt), model.line_items.export(fmt))
+    if logo_missing: # Backdated so is_up_to_date() lets the next run add the logo
+        input_mtime = os.path.getmtime(input_path)
+        os.utime(output_path, (input_mtime - 1, input_mtime - 1))
+        warnings.append("written without the logo; the next run converts it again (--no-logo to keep it this way)")
+    warnings.extend(
+        f"{d.check} mismatch (table {d.table}, row {d.row}): expected {d.expected}, found {d.actual}"
+        for d in model.line_items.validate()
+    )
+    return count_pages(input_path), warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="budgetbox", description="Convert vertical proposal PDFs to the landscape layout.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="transformed")
+    parser.add_argument("-j", "--jobs", type=int, default=default_workers(), help="files converted in parallel")
+    parser.add_argument("--page-workers", type=int, default=1, help="worker processes per file for large proposals")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=os.environ.get("BUDGETBOX_BACKEND", DEFAULT_BACKEND))
+    parser.add_argument("--strict", action="store_true", help="run table detection on every page (no triage)")
+    parser.add_argument("--export", action="append", choices=EXPORT_FORMATS, default=[], help="also write the line items (repeatable)")
+    parser.add_argument("--no-logo", action="store_true", help="render without the logo")
+    parser.add_argument("-f", "--force", action="store_true", help="convert even when the output is up to date")
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("No PDF inputs found.", file=sys.stderr)
+        return 2
+    os.makedirs(args.output_dir, exist_ok=True)
+    if not args.no_logo:
+        get_logo(wait=True) # Fill the on-disk logo cache once so workers never download it
+
+    planned, collisions = plan_outputs(inputs, args.output_dir)
+    for input_path, owner in collisions:
+        print(f"failed      {input_path}: its output name is already used by {owner}; rename it or convert it separately",
+              file=sys.stderr)
+    pending = []
+    for input_path, output_path in planned:
+        if not args.force and is_up_to_date(input_path, output_path, args.export):
+            print(f"up to date  {input_path}")
+        else:
+            pending.append((input_path, output_path))
+
+    start = time.perf_counter()
+    converted_files = converted_pages = 0
+    failed = len(collisions)
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(pending))), mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(convert_file, input_path, output_path, args.backend, args.page_workers, args.strict, args.export,
+                            not args.no_logo): input_path
+                for input_path, output_path in pending
+            }
+            for future in as_completed(futures):
+                input_path = futures[future]
+                try:
+                    pages, warnings = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"failed      {input_path}: {e}", file=sys.stderr)
+                    continue
+                converted_files += 1
+                converted_pages += pages
+                print(f"converted   {input_path} ({pages} pages)")
+                for warning in warnings:
+                    print(f"  warning: {warning}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{converted_files} converted, {len(planned) - len(pending)} up to date, {failed} failed in {elapsed:.1f}s"
+        f" ({converted_pages / elapsed if elapsed else 0:.1f} pages/s, {converted_files / elapsed if elapsed else 0:.2f} files/s)"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
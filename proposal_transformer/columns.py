@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Header and cell classification for extracted tables, compiled once per process.
+
+A table's header row decides which column feeds which output column (see HEADERS in
+extract.py). Header synonyms are plain lower-case substrings; "month !amount" means
+"contains month but not amount". A field takes the first header cell matching any of
+its synonyms. Proposals repeat one header on every page, so each distinct header
+(its lower-cased cells) is classified once and the ColumnMapping is reused.
+
+Cells in columns the header did not map are typed one column at a time. One combined
+regex finds every date, count, "mo", "$" and date/term label in a cell in a single
+pass, and the type of each distinct cell text is cached.
+
+Vendors' header variants go in a JSON file named by BUDGETBOX_COLUMN_MAPPINGS, or
+in the variable itself as inline JSON, for example {"monthly": ["mrc", "per month"]}.
+Their synonyms are added to the defaults.
+"""
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+FIELD_SLOTS = {"desc": 0, "start_date": 1, "end_date": 2, "term": 3, "monthly": 4, "total": 5, "notes": 6}
+DEFAULT_SYNONYMS = {
+    "desc": ["description"],
+    "notes": ["note", "comment"],
+    "start_date": ["start date"],
+    "end_date": ["end date"],
+    "term": ["term", "month !amount"],
+    "monthly": ["monthly"],
+    "total": ["total !grand !month"],
+}
+
+# Cell types of unmapped columns, in the order the fallback tries them
+DATE, TERM, MONEY, NOTE = "date", "term", "money", "note"
+CELL_TYPE_RE = re.compile(
+    r"(?=(?P<date>\d{1,2}[/-]\d{1,2}[/-]\d{2,4})|(?P<count>\A\d{1,3}\Z)|(?P<mo>mo)|(?P<money>\$)|(?P<label>date|term))",
+    re.I,
+) # Zero-width, so overlapping hits ("termo") are all found
+
+ColumnMapping = namedtuple("ColumnMapping", "indices mapped monthly_columns total_columns")
+
+
+@lru_cache(maxsize=8192) # Dates, terms and amounts repeat across rows
+def cell_type(text):
+    """DATE, TERM, MONEY, NOTE or None for the non-empty, stripped text of an unmapped cell."""
+    found = {m.lastgroup for m in CELL_TYPE_RE.finditer(text)}
+    if "date" in found:
+        return DATE
+    if "count" in found or "mo" in found: # "mo" covers "month" too
+        return TERM
+    if "money" in found:
+        return MONEY
+    if len(text) > 3 and "label" not in found:
+        return NOTE
+    return None
+
+
+def column_types(column):
+    """cell_type of every cell in a column; None for empty cells."""
+    return [cell_type(text) if text else None for text in column]
+
+
+def parse_synonym(synonym):
+    include, *excludes = (part.strip().lower() for part in synonym.split("!"))
+    return include, tuple(excludes)
+
+
+class ColumnClassifier:
+    def __init__(self, synonyms=None):
+        synonyms = synonyms or DEFAULT_SYNONYMS
+        unknown = set(synonyms) - set(FIELD_SLOTS)
+        if unknown:
+            raise ValueError(f"Unknown column field(s) {', '.join(sorted(unknown))}; expected {', '.join(FIELD_SLOTS)}")
+        self.rules = {field: [parse_synonym(s) for s in synonyms.get(field, ())] for field in FIELD_SLOTS}
+        self._mappings = {} # header signature -> ColumnMapping
+
+    def matches(self, field, header):
+        return any(include in header and not any(x in header for x in excludes) for include, excludes in self.rules[field])
+
+    def mentions(self, field, header):
+        """Looser than matches(): exclusions are ignored. Unmapped money cells prefer the
+        Monthly or Item Total slot of any column whose header mentions that field."""
+        return any(include in header for include, _ in self.rules[field])
+
+    def classify(self, header_cells):
+        """ColumnMapping for a header row (stripped cell texts), cached by its lower-cased cells."""
+        signature = tuple(h.lower() for h in header_cells)
+        mapping = self._mappings.get(signature)
+        if mapping is None:
+            indices = {field: next((i for i, h in enumerate(signature) if self.matches(field, h)), None) for field in FIELD_SLOTS}
+            if indices["desc"] is None:
+                indices["desc"] = 0 # The first column is the description unless a header says otherwise
+            mapping = ColumnMapping(
+                indices,
+                frozenset(i for i in indices.values() if i is not None),
+                frozenset(i for i, h in enumerate(signature) if self.mentions("monthly", h)),
+                frozenset(i for i, h in enumerate(signature) if self.mentions("total", h)),
+            )
+            self._mappings[signature] = mapping
+        return mapping
+
+
+def load_synonyms(config=None):
+    """DEFAULT_SYNONYMS extended by config: a JSON file path, inline JSON or None for BUDGETBOX_COLUMN_MAPPINGS."""
+    config = os.environ.get("BUDGETBOX_COLUMN_MAPPINGS", "") if config is None else config
+    synonyms = {field: list(values) for field, values in DEFAULT_SYNONYMS.items()}
+    if not config.strip():
+        return synonyms
+    if config.lstrip().startswith("{"):
+        extra = json.loads(config)
+    else:
+        with open(config, encoding="utf-8") as f:
+            extra = json.load(f)
+    for field, values in extra.items():
+        synonyms.setdefault(field, []).extend([values] if isinstance(values, str) else values)
+    return synonyms
+
+
+@lru_cache(maxsize=None)
+def get_classifier():
+    return ColumnClassifier(load_synonyms())
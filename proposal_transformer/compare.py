@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Runs every extraction backend over the same PDFs and reports disagreements and timings.
+
+    python -m proposal_transformer.compare proposals/*.pdf
+"""
+import argparse
+import sys
+import time
+
+from proposal_transformer.backends import BACKENDS, DEFAULT_BACKEND
+from proposal_transformer.extract import extract_proposal
+
+
+def diff_results(reference, candidate):
+    """Lists the parts of two ExtractedProposal results that differ."""
+    ref_tables, ref_grand, ref_title = reference[:3]
+    cand_tables, cand_grand, cand_title = candidate[:3]
+    diffs = []
+    if ref_title != cand_title:
+        diffs.append("title")
+    if ref_grand != cand_grand:
+        diffs.append("grand_total")
+    if len(ref_tables) != len(cand_tables):
+        diffs.append(f"table count {len(ref_tables)} != {len(cand_tables)}")
+    for t_idx, (ref_table, cand_table) in enumerate(zip(ref_tables, cand_tables)):
+        _, ref_rows, ref_links, ref_total = ref_table
+        _, cand_rows, cand_links, cand_total = cand_table
+        if ref_rows != cand_rows:
+            diffs.append(f"table {t_idx} rows")
+        if ref_links != cand_links:
+            diffs.append(f"table {t_idx} links")
+        if ref_total != cand_total:
+            diffs.append(f"table {t_idx} total")
+    return diffs
+
+
+def compare_backends(paths, backends=None, reference=DEFAULT_BACKEND, strict=False):
+    backends = backends or list(BACKENDS)
+    timings = {name: 0.0 for name in backends}
+    differing = {name: 0 for name in backends if name != reference}
+    for path in paths:
+        results = {}
+        for name in backends:
+            start = time.perf_counter()
+            try:
+                results[name] = extract_proposal(path, backend=name, strict=strict)
+            except Exception as e:
+                results[name] = e
+            timings[name] += time.perf_counter() - start
+        for name in differing:
+            if isinstance(results[name], Exception) or isinstance(results[reference], Exception):
+                diffs = [f"error: {results[name]!r}" if isinstance(results[name], Exception) else f"reference error: {results[reference]!r}"]
+            else:
+                diffs = diff_results(results[reference], results[name])
+            if diffs:
+                differing[name] += 1
+                print(f"{path}: {name} differs from {reference}: {', '.join(diffs)}")
+    return timings, differing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--reference", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--strict", action="store_true", help="disable page triage")
+    args = parser.parse_args(argv)
+    backends = args.backends if args.reference in args.backends else [args.reference] + args.backends
+
+    timings, differing = compare_backends(args.pdfs, backends, args.reference, args.strict)
+    n_files = len(args.pdfs)
+    print(f"\n{n_files} file(s), reference backend: {args.reference}")
+    for name in backends:
+        line = f"  {name:<12} {timings[name]:8.2f}s total  {timings[name] / n_files:7.2f}s/file"
+        if name in differing:
+            line += f"  differs on {differing[name]}/{n_files} ({100.0 * differing[name] / n_files:.0f}%)"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""Turns a proposal PDF into the (headers, rows, links, total) tables the renderer lays out,
+plus the same rows as typed line items (see line_items.py)."""
+import re
+from collections import namedtuple
+
+from proposal_transformer.backends import DEFAULT_BACKEND, open_backend
+from proposal_transformer.columns import DATE, FIELD_SLOTS, MONEY, TERM, column_types, get_classifier
+from proposal_transformer.line_items import build_line_items
+from proposal_transformer.profiling import NULL_PROFILER
+
+HEADERS = [
+    "Description", "Start Date", "End Date", "Term (Months)",
+    "Monthly Amount", "Item Total", "Notes"
+]
+
+ExtractedProposal = namedtuple("ExtractedProposal", "tables_info grand_total proposal_title line_items")
+
+TOTAL_AMOUNT_RE = re.compile(r'\$\s*[\d,]+(?:\.\d{1,2})?')
+GRAND_TOTAL_RE = re.compile(r'Grand\s+Total.*?(\$\s*[\d,]+\.\d{2})', re.I | re.S)
+
+
+def is_total_line(line):
+    """A line find_total may match: 'Total ...'/'Subtotal ...' with a dollar amount, not the grand total."""
+    lower = line.lower()
+    return "grand total" not in lower and ("total" in lower or "subtotal" in lower) and \
+        bool(TOTAL_AMOUNT_RE.search(line)) and lower.strip().startswith(("total", "subtotal"))
+
+
+def condense_page_text(page_index, text):
+    """The part of a page's text that assemble_proposal reads, so full page texts are not held.
+
+    Page 0 is kept whole for the title. Other pages keep their candidate total lines, in
+    order, after one normalized "Grand Total $X" line when the page has a grand total.
+    """
+    if page_index == 0:
+        return text
+    lines = [line for line in text.splitlines() if is_total_line(line)]
+    m_grand = GRAND_TOTAL_RE.search(text)
+    if m_grand:
+        lines.insert(0, f"Grand Total {m_grand.group(1)}")
+    return "\n".join(lines)
+
+
+def extract_tables_from_page(page_content, rich_cell, profiler=NULL_PROFILER, classifier=None):
+    """Maps every table on one page to (rows, row links, total row cells or None).
+
+    rich_cell(page_index, bbox) returns the bold-aware markup of a cell. Nothing here
+    depends on other pages, so pages can be processed in any order or process. Columns
+    are mapped by classifier (default: columns.get_classifier()).
+    """
+    classifier = classifier or get_classifier()
+    page_tables = []
+    current_page_idx_fitz = page_content.index
+    for table in page_content.tables:
+        data, cell_rows = table.data, table.cell_rows
+        if not data or len(data) < 2: continue
+        hdr = [str(h).strip().replace('\n', ' ') for h in data[0]]
+
+        mapping = classifier.classify(hdr)
+        col_indices = mapping.indices
+
+        desc_links_map = {}
+        if cell_rows and col_indices["desc"] is not None:
+            with profiler.stage("hyperlink_matching", page=current_page_idx_fitz):
+                for r_idx, row_cells in enumerate(cell_rows): # r_idx is 0-based here
+                    if r_idx == 0: continue # Skip header row
+                    if col_indices["desc"] < len(row_cells) and row_cells[col_indices["desc"]]:
+                        cell_bbox_val = row_cells[col_indices["desc"]]
+                        x0_c, top_c, x1_c, bottom_c = cell_bbox_val
+                        for link_item in page_content.links:
+                            if all(k in link_item for k in ("x0", "x1", "top", "bottom", "uri")):
+                                if not (link_item["x1"] < x0_c or link_item["x0"] > x1_c or link_item["bottom"] < top_c or link_item["top"] > bottom_c):
+                                    desc_links_map[r_idx] = link_item["uri"] # Use r_idx from cell_rows
+                                    break
+
+        processed_table_rows = []
+        ordered_row_links = []
+        current_table_total_content = None
+
+        body_rows = [] # (ridx_data, cells); ridx_data is 1-based for the data list
+        for ridx_data, row_content_list in enumerate(data[1:], start=1):
+            cells = [str(c).strip() if c is not None else "" for c in row_content_list]
+            if not any(cells): continue
+
+            first_cell_lower = cells[0].lower() if cells else ""
+            if ("total" in first_cell_lower or "subtotal" in first_cell_lower) and any("$" in c for c in cells):
+                if current_table_total_content is None: current_table_total_content = cells
+                continue
+            body_rows.append((ridx_data, cells))
+
+        # Fallback guessing for columns the header did not map: type each column once, fill rows below
+        n_columns = max((len(cells) for _, cells in body_rows), default=0)
+        fallback_types = {
+            cell_idx: column_types([cells[cell_idx] if cell_idx < len(cells) else "" for _, cells in body_rows])
+            for cell_idx in range(n_columns) if cell_idx not in mapping.mapped
+        }
+
+        def escape_cell(raw_text):
+            return raw_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\n", "<br/>")
+
+        for row_pos, (ridx_data, cells) in enumerate(body_rows):
+            new_row_output = [""] * len(HEADERS)
+
+            for key in ("desc", "notes"):
+                col_idx_val = col_indices[key]
+                if col_idx_val is not None and col_idx_val < len(cells):
+                    raw_text = cells[col_idx_val]
+                    # For rich text, cell_rows index corresponds to ridx_data (since cell_rows includes header)
+                    if cell_rows and ridx_data < len(cell_rows) and \
+                       col_idx_val < len(cell_rows[ridx_data]) and cell_rows[ridx_data][col_idx_val]:
+                        rich_text = rich_cell(current_page_idx_fitz, cell_rows[ridx_data][col_idx_val])
+                        new_row_output[FIELD_SLOTS[key]] = rich_text or escape_cell(raw_text)
+                    else:
+                        new_row_output[FIELD_SLOTS[key]] = escape_cell(raw_text)
+
+            for key in ("start_date", "end_date", "term", "monthly", "total"):
+                col_idx_val = col_indices[key]
+                if col_idx_val is not None and col_idx_val < len(cells):
+                    new_row_output[FIELD_SLOTS[key]] = cells[col_idx_val]
+
+            for cell_idx, types in fallback_types.items():
+                kind = types[row_pos]
+                if kind is None: continue
+                cell_val = cells[cell_idx]
+                if kind == DATE:
+                    if not new_row_output[1]: new_row_output[1] = cell_val
+                    elif not new_row_output[2]: new_row_output[2] = cell_val
+                elif kind == TERM:
+                    if not new_row_output[3]: new_row_output[3] = cell_val.replace("months", "").replace("month", "").strip()
+                elif kind == MONEY:
+                    if not new_row_output[4] and cell_idx in mapping.monthly_columns: new_row_output[4] = cell_val
+                    elif not new_row_output[5] and cell_idx in mapping.total_columns: new_row_output[5] = cell_val
+                    elif not new_row_output[4]: new_row_output[4] = cell_val
+                    elif not new_row_output[5]: new_row_output[5] = cell_val
+                elif not new_row_output[6]: # NOTE
+                    new_row_output[6] = escape_cell(cell_val)
+
+            if any(new_row_output[i_val].strip().replace('\n',' ') == HEADERS[i_val] for i_val in range(len(HEADERS)) if new_row_output[i_val]):
+                continue
+            processed_table_rows.append(new_row_output)
+            # cell_rows r_idx is 0-based, data row list is 1-based (ridx_data)
+            # desc_links_map is keyed by r_idx, i.e. the index in cell_rows
+            # cell_rows[0] is header, so cell_rows[1] is first data row (corresponds to ridx_data=1)
+            ordered_row_links.append(desc_links_map.get(ridx_data))
+
+        # Totals found in the page text are matched later, in page order (see assemble_proposal)
+        page_tables.append((processed_table_rows, ordered_row_links, current_table_total_content))
+        profiler.count("tables")
+        profiler.count("rows", len(processed_table_rows))
+    return page_tables
+
+
+def extract_page_range(pdf_source, backend=DEFAULT_BACKEND, page_numbers=None, profiler=NULL_PROFILER, strict=False):
+    """Returns [(page index, condensed page text, page tables)] for page_numbers, or for every page when None."""
+    page_results = []
+    with open_backend(backend, pdf_source, profiler=profiler, strict=strict) as source:
+        if page_numbers is None:
+            page_numbers = range(source.page_count)
+        page_iter = source.pages(page_numbers)
+        for page_index in page_numbers: # One PageContent per requested page
+            with profiler.stage("page", page=page_index):
+                page_content = next(page_iter)
+                page_tables = extract_tables_from_page(page_content, source.rich_cell, profiler)
+                page_results.append((page_content.index, condense_page_text(page_content.index, page_content.text), page_tables))
+            profiler.count("pages")
+        page_iter.close()
+    return page_results
+
+
+def assemble_proposal(page_results, profiler=NULL_PROFILER):
+    """Merges per-page results (in page order) into an ExtractedProposal."""
+    tables_info = []
+    grand_total = None
+    proposal_title = "Untitled Proposal"
+    texts_content = [(page_index, text) for page_index, text, _ in page_results]
+
+    used_total_lines = set()
+    # --- REFINED find_total function ---
+    def find_total(page_idx_for_texts_list):
+        if page_idx_for_texts_list >= len(texts_content):
+            return None
+        actual_page_num_for_key, text_content_on_page = texts_content[page_idx_for_texts_list]
+        
+        for l_line in text_content_on_page.splitlines():
+            line_key = (actual_page_num_for_key, l_line)
+            if is_total_line(l_line) and line_key not in used_total_lines:
+                used_total_lines.add(line_key)
+                return l_line.strip()
+        return None
+    # --- End of REFINED find_total function ---
+
+    for current_page_idx_fitz, _, page_tables in page_results:
+        for processed_table_rows, ordered_row_links, current_table_total_content in page_tables:
+            if current_table_total_content is None: 
+                with profiler.stage("find_total", page=current_page_idx_fitz):
+                    current_table_total_content = find_total(current_page_idx_fitz)
+
+            if processed_table_rows: 
+                tables_info.append((HEADERS, processed_table_rows, ordered_row_links, current_table_total_content))
+
+    # Extract Proposal Title
+    first_page_idx_content, first_text_content = texts_content[0] if texts_content else (0, "")
+    first_lines_content = first_text_content.splitlines()
+    pot_title = next((l.strip() for l in first_lines_content if "proposal" in l.lower() and len(l.strip()) > 10), None)
+    if pot_title:
+        proposal_title = pot_title
+    elif first_lines_content:
+        proposal_title = next((l.strip() for l in first_lines_content if l.strip()), "Untitled Proposal")
+
+    for page_idx_fitz_rev, blk_text_rev in reversed(texts_content):
+        m_grand = GRAND_TOTAL_RE.search(blk_text_rev)
+        if m_grand:
+            grand_total = m_grand.group(1).replace(" ", "")
+            break
+
+    with profiler.stage("line_items"):
+        line_items = build_line_items(tables_info, grand_total, proposal_title)
+    return ExtractedProposal(tables_info, grand_total, proposal_title, line_items)
+
+
+def extract_proposal(pdf_source, backend=DEFAULT_BACKEND, workers=1, profiler=NULL_PROFILER, strict=False):
+    """Returns the ExtractedProposal (tables_info, grand_total, proposal_title, line_items) for pdf_source,
+    the PDF's bytes or a path to it. A path is opened in place by every parser (streaming mode).
+
+    With workers > 1, documents of at least PARALLEL_MIN_PAGES pages are split into page
+    ranges processed by a pool of worker processes; the result is identical to workers=1.
+    strict=True runs the table detectors on every page instead of only on pages that
+    pass the triage prefilter. Scanned pages are OCR'd first when Tesseract is available
+    (see ocr.py).
+    """
+    from proposal_transformer.ocr import text_layer_source
+
+    with profiler.stage("extract"), text_layer_source(pdf_source, workers=workers, profiler=profiler) as pdf_source:
+        page_results = None
+        if workers > 1:
+            from proposal_transformer.parallel import PARALLEL_MIN_PAGES, count_pages, extract_pages_parallel
+
+            page_count = count_pages(pdf_source)
+            if page_count >= PARALLEL_MIN_PAGES:
+                page_results = extract_pages_parallel(pdf_source, backend, workers, page_count, profiler, strict)
+        if page_results is None:
+            page_results = extract_page_range(pdf_source, backend, profiler=profiler, strict=strict)
+        with profiler.stage("assemble"):
+            return assemble_proposal(page_results, profiler)
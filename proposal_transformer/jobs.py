@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Background conversion jobs on a bounded process pool, with progress and cancellation.
+
+    queue = JobQueue(max_workers=2)
+    job_id = queue.submit(pdf_bytes)   # or a file path, which workers open in place
+    queue.status(job_id)   # {"state": "running", "pages_scanned": 12, "pages_total": 60, ...}
+    result = queue.result(job_id)  # {"pdf_bytes": ..., "tables_info": ..., ...}
+
+Each job runs extract() and render() in a worker process and reports pages scanned,
+tables found and render progress through a shared dict. Cancellation is checked at
+every pipeline stage and while the PDF is being built. Jobs are keyed by
+cache.result_key (content hash, backend, mode and column mappings), so submitting the
+same PDF again returns the queued, running or finished job instead of converting it
+twice. Workers are spawned, so scripts that use a JobQueue need an
+`if __name__ == "__main__":` guard.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from proposal_transformer.backends import DEFAULT_BACKEND, is_pdf_path
+from proposal_transformer.cache import content_key, file_content_key, result_key
+from proposal_transformer.parallel import default_workers
+from proposal_transformer.profiling import NullProfiler
+
+MAX_FINISHED_JOBS = 32 # Finished jobs kept for de-duplication and result lookup
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class ProgressReporter(NullProfiler):
+    """Turns the pipeline's profiler hooks into progress updates and cancellation checks."""
+
+    def __init__(self, progress, cancel_event):
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self._render_percent = -1
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    @contextmanager
+    def stage(self, name, page=None):
+        self.check_cancelled()
+        yield {}
+
+    def count(self, name, n=1):
+        self.check_cancelled() # Between pages, and between chunks of a page-parallel extraction
+        if name == "pages":
+            self.progress["pages_scanned"] += n
+        elif name == "tables":
+            self.progress["tables_found"] += n
+
+    def render_progress(self, fraction):
+        self.check_cancelled()
+        percent = int(fraction * 100)
+        if percent != self._render_percent: # Each update is a round trip to the manager process
+            self._render_percent = percent
+            self.progress["render_percent"] = percent
+
+
+def run_job(pdf_source, backend, strict, progress, cancel_event, workers=1):
+    """Worker side of a job: returns the result dict budgetbox.py caches, or raises.
+    workers > 1 extracts the pages of a large proposal in that many processes. logo_missing
+    in the result tells the caller to render the cached model again once the logo loads."""
+    from proposal_transformer.assets import get_logo
+    from proposal_transformer.parallel import count_pages
+    from proposal_transformer.pipeline import ensure_reformattable, extract, render
+
+    reporter = ProgressReporter(progress, cancel_event)
+    progress["pages_total"] = count_pages(pdf_source)
+    progress["state"] = "running"
+    get_logo() # A fresh worker starts loading the logo while the pages are extracted
+    model = ensure_reformattable(extract(pdf_source, backend=backend, workers=workers, profiler=reporter, strict=strict))
+    warnings = []
+    logo_missing = get_logo(wait=True) is None # Waits for a download in progress rather than rendering without it
+    output_pdf_bytes = render(model, on_warning=warnings.append, profiler=reporter, on_progress=reporter.render_progress)
+    return {
+        "tables_info": model.tables_info, "grand_total": model.grand_total,
+        "proposal_title": model.proposal_title, "line_items": model.line_items, "pdf_bytes": output_pdf_bytes,
+        "warnings": warnings, "profile": None, "logo_missing": logo_missing,
+    }
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Job:
+    def __init__(self, job_id, key, progress=None, cancel_event=None):
+        self.id = job_id
+        self.key = key
+        self.progress = progress # Manager dict shared with the worker; None for cache hits
+        self.cancel_event = cancel_event
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.future = None
+        self.source_path = None # Spooled input the queue deletes once the job is done
+        self.waiters = set() # Callers still waiting for the result; see JobQueue.cancel
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+
+class JobQueue:
+    def __init__(self, max_workers=None, result_cache=None):
+        self._context = multiprocessing.get_context("spawn") # As in parallel.py: the parent may be a threaded server
+        self.max_workers = max_workers or default_workers()
+        self.result_cache = result_cache
+        self._manager = self._context.Manager()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+        self._jobs = {} # job_id -> Job
+        self._by_key = {} # content key -> job_id of its latest queued, running or finished job
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def page_workers(self, requested):
+        """requested page workers per job, capped so max_workers jobs at once fit the CPUs."""
+        return max(1, min(requested, (os.cpu_count() or 1) // self.max_workers))
+
+    def submit(self, pdf_source, backend=DEFAULT_BACKEND, strict=False, source_key=None, workers=1, check_cache=True,
+               delete_source=False, waiter=None):
+        """Returns a job id; an identical active or finished job is reused, not repeated.
+
+        pdf_source is the PDF's bytes or a path to it; a path must stay in place until the
+        job is done. source_key is its content_key when the caller already has it. workers
+        is the page-parallel extraction requested for the job (see page_workers). Pass
+        check_cache=False when the caller has just looked the job up in the result cache.
+        delete_source=True hands the file at pdf_source to the queue: it is deleted when the
+        job is done, or at once when an existing job or cached result is used instead.
+        waiter identifies the caller (e.g. a browser session) for cancel().
+        """
+        if source_key is None:
+            source_key = file_content_key(pdf_source) if is_pdf_path(pdf_source) else content_key(pdf_source)
+        key = result_key(source_key, backend, strict)
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.state in ACTIVE_STATES + ("done",):
+                if delete_source:
+                    remove_file(pdf_source)
+                if waiter is not None:
+                    existing.waiters.add(waiter)
+                return existing.id
+            self._next_id += 1
+            job_id = str(self._next_id)
+            cached = self.result_cache.get(key) if self.result_cache is not None and check_cache else None
+            if cached is not None:
+                job = Job(job_id, key)
+                self._finish(job, "done", result=cached)
+                if delete_source:
+                    remove_file(pdf_source)
+            else:
+                progress = self._manager.dict(state="queued", pages_total=0, pages_scanned=0, tables_found=0, render_percent=0)
+                job = Job(job_id, key, progress, self._manager.Event())
+                job.source_path = pdf_source if delete_source else None
+                if waiter is not None:
+                    job.waiters.add(waiter)
+                job.future = self._submit_to_pool(pdf_source, backend, strict, progress, job.cancel_event, self.page_workers(workers))
+            self._jobs[job_id] = job
+            self._by_key[key] = job_id
+            self._prune()
+        if job.future is not None:
+            job.future.add_done_callback(lambda future, job=job: self._on_done(job, future))
+        return job_id
+
+    def _submit_to_pool(self, *args):
+        try:
+            return self._pool.submit(run_job, *args)
+        except BrokenProcessPool: # A worker died (e.g. out of memory); its job failed, later ones get a new pool
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+            return self._pool.submit(run_job, *args)
+
+    def _on_done(self, job, future):
+        if job.source_path is not None:
+            remove_file(job.source_path)
+        try:
+            result = future.result()
+        except (CancelledError, JobCancelled):
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", error=e)
+        else:
+            if self.result_cache is not None:
+                self.result_cache.put(job.key, result)
+            self._finish(job, "done", result=result)
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state, job.result, job.error = state, result, error
+        job.finished_at = time.time()
+        job.done.set()
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job.done.is_set()), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+
+    def status(self, job_id):
+        """Snapshot: state, pages_total, pages_scanned, tables_found, render_percent and error."""
+        job = self._jobs[job_id]
+        status = {"id": job.id, "state": job.state, "pages_total": 0, "pages_scanned": 0, "tables_found": 0, "render_percent": 0}
+        if job.progress is not None:
+            try:
+                status.update(job.progress.copy()) # The worker moves "state" from queued to running
+            except (EOFError, OSError): # Manager already shut down
+                pass
+        if job.done.is_set():
+            status["state"] = job.state
+            if job.state == "done":
+                status["render_percent"] = 100
+        status["error"] = job.error
+        return status
+
+    def result(self, job_id, timeout=None):
+        """Waits for the job; returns its result dict or raises its error (JobCancelled when cancelled)."""
+        job = self._jobs[job_id]
+        if not job.done.wait(timeout):
+            raise TimeoutError(f"job {job_id} still {job.state}")
+        if job.state == "cancelled":
+            raise JobCancelled(f"job {job_id} was cancelled")
+        if job.state == "failed":
+            raise job.error
+        return job.result
+
+    def cancel(self, job_id, waiter=None):
+        """Cancels a queued job at once, or a running one at its next stage boundary.
+
+        With a waiter, only that caller stops waiting, and the job itself is cancelled once
+        no other waiter is left: one session cannot cancel a conversion another awaits.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            if waiter is not None:
+                job.waiters.discard(waiter)
+                if job.waiters:
+                    return False
+        if job.done.is_set():
+            return False
+        if job.future is not None and job.future.cancel():
+            return True
+        job.cancel_event.set()
+        return True
+
+    def shutdown(self, cancel_running=True):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if cancel_running:
+            for job in jobs:
+                if not job.done.is_set():
+                    self.cancel(job.id)
+        self._pool.shutdown(wait=True)
+        self._manager.shutdown()
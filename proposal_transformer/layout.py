@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Output settings of the rendered PDF, kept apart from render.py so they load without ReportLab.
+
+RenderOptions() reproduces the original layout: a 17x11 in landscape page, the
+proposal's own title, the configured logo and the 30/8/8/6/10/10/28 % column split.
+Options are hashable, so they can key caches of rendered output.
+"""
+from collections import namedtuple
+
+PAGE_SIZES = { # Landscape width x height in inches
+    "17x11 (ledger)": (17, 11),
+    "14x8.5 (legal)": (14, 8.5),
+    "11x8.5 (letter)": (11, 8.5),
+    "A3": (16.54, 11.69),
+    "A4": (11.69, 8.27),
+}
+DEFAULT_PAGE_SIZE = "17x11 (ledger)"
+DEFAULT_COLUMN_WIDTHS = (0.30, 0.08, 0.08, 0.06, 0.10, 0.10, 0.28) # Fractions of the table width, one per HEADERS column
+
+# title: None keeps the extracted title. logo: None is the configured logo (assets.get_logo),
+# b"" leaves it out and other bytes are an image to use instead.
+RenderOptions = namedtuple("RenderOptions", "title page_size column_widths logo",
+                           defaults=(None, DEFAULT_PAGE_SIZE, DEFAULT_COLUMN_WIDTHS, None))
+
+
+def column_fractions(widths):
+    """widths (any positive numbers, e.g. percentages) scaled to fractions that sum to 1."""
+    if len(widths) != len(DEFAULT_COLUMN_WIDTHS) or any(w <= 0 for w in widths):
+        raise ValueError(f"Expected {len(DEFAULT_COLUMN_WIDTHS)} positive column widths, got {list(widths)}")
+    total = sum(widths)
+    return tuple(w / total for w in widths)
+
+
+def page_size_inches(name):
+    if name not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size {name!r}; choose one of {', '.join(PAGE_SIZES)}")
+    return PAGE_SIZES[name]
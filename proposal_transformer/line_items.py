@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Typed line items parsed once from the extracted tables, for validation and export.
+
+tables_info keeps the escaped-HTML strings the renderer lays out. ProposalLineItems
+holds the same rows as values: amounts as Decimal, dates as datetime.date, the term
+as an int, with the rich markup of Description and Notes kept beside their plain
+text. Cells that do not parse keep their text in LineItem.unparsed, so an export never
+loses what the PDF said.
+"""
+import csv
+import html
+import io
+import json
+import re
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+MONEY_RE = re.compile(r'(-)?\$\s*([\d,]+(?:\.\d+)?)')
+TERM_RE = re.compile(r'\d+')
+TAG_RE = re.compile(r'<[^>]+>')
+BR_RE = re.compile(r'<br\s*/?>', re.I)
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y", "%m-%d-%y", "%Y-%m-%d", "%B %d, %Y", "%b %d, %Y")
+CENT = Decimal("0.01")
+EXPORT_COLUMNS = ["table", "description", "start_date", "end_date", "term_months", "monthly_amount", "item_total", "notes", "link"]
+MONEY_COLUMNS = ("monthly_amount", "item_total")
+
+Discrepancy = namedtuple("Discrepancy", "check table row expected actual")
+
+
+@lru_cache(maxsize=4096) # Proposals repeat the same few dates and amounts many times
+def parse_date(text):
+    text = text.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_amount(text):
+    """Last dollar amount in text as a Decimal, or None."""
+    matches = MONEY_RE.findall(text)
+    if not matches:
+        return None
+    sign, digits = matches[-1]
+    try:
+        value = Decimal(digits.replace(",", ""))
+    except InvalidOperation:
+        return None
+    return -value if sign else value
+
+
+def parse_term(text):
+    match = TERM_RE.search(text)
+    return int(match.group()) if match else None
+
+
+def plain_text(markup):
+    """Cell markup (<b>, <br/>, escaped entities) as plain text with line breaks."""
+    return html.unescape(TAG_RE.sub("", BR_RE.sub("\n", markup))).strip()
+
+
+def parse_total(total):
+    """A table total as extractor found it: the total row's cells, a 'Total ... $X' line or None."""
+    if total is None:
+        return None
+    if isinstance(total, str):
+        return parse_amount(total)
+    return next((parse_amount(cell) for cell in reversed(total) if "$" in str(cell)), None)
+
+
+@dataclass
+class LineItem:
+    __slots__ = (
+        "table", "description", "description_markup", "start_date", "end_date", "term_months",
+        "monthly_amount", "item_total", "notes", "notes_markup", "link", "unparsed",
+    )
+    table: int
+    description: str
+    description_markup: str
+    start_date: date
+    end_date: date
+    term_months: int
+    monthly_amount: Decimal
+    item_total: Decimal
+    notes: str
+    notes_markup: str
+    link: str
+    unparsed: dict # column -> cell text for non-empty cells that did not parse; None when all parsed
+
+    def record(self):
+        """Export values: parsed where possible, the original text where not."""
+        unparsed = self.unparsed or {}
+        return {column: unparsed.get(column, getattr(self, column)) for column in EXPORT_COLUMNS}
+
+
+@dataclass
+class TableTotal:
+    __slots__ = ("table", "subtotal", "subtotal_text")
+    table: int
+    subtotal: Decimal
+    subtotal_text: str
+
+
+@dataclass
+class ProposalLineItems:
+    __slots__ = ("title", "items", "totals", "grand_total")
+    title: str
+    items: list # LineItem, in table then row order
+    totals: list # TableTotal, one per table
+    grand_total: Decimal
+
+    def validate(self, tolerance=CENT):
+        """Checks Monthly x Term against Item Total, the items since the previous subtotal against
+        each subtotal and the subtotals (or, without them, all items) against the Grand Total.
+        Returns Discrepancy tuples."""
+        discrepancies = []
+        table_sums = {total.table: Decimal("0") for total in self.totals}
+        table_rows = {total.table: 0 for total in self.totals}
+        for item in self.items:
+            row_idx = table_rows[item.table] # Discrepancy.row counts from 0 within its table
+            table_rows[item.table] += 1
+            if item.item_total is not None:
+                table_sums[item.table] += item.item_total
+            if None not in (item.monthly_amount, item.term_months, item.item_total):
+                expected = item.monthly_amount * item.term_months
+                if abs(expected - item.item_total) > tolerance * max(item.term_months, 1): # Monthly may be rounded to the cent
+                    discrepancies.append(Discrepancy("monthly_x_term", item.table, row_idx, expected, item.item_total))
+        since_last_subtotal = Decimal("0") # A table split across pages only has its subtotal on the last part
+        for total in self.totals:
+            since_last_subtotal += table_sums[total.table]
+            if total.subtotal is not None:
+                if abs(since_last_subtotal - total.subtotal) > tolerance:
+                    discrepancies.append(Discrepancy("table_subtotal", total.table, None, since_last_subtotal, total.subtotal))
+                since_last_subtotal = Decimal("0")
+        if self.grand_total is not None and self.totals:
+            subtotals = [total.subtotal for total in self.totals if total.subtotal is not None]
+            expected = sum(subtotals) if self.totals[-1].subtotal is not None else sum(table_sums.values())
+            if abs(expected - self.grand_total) > tolerance:
+                discrepancies.append(Discrepancy("grand_total", None, None, expected, self.grand_total))
+        return discrepancies
+
+    def records(self):
+        return [item.record() for item in self.items]
+
+    def to_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+        for record in self.records():
+            writer.writerow({k: v.isoformat() if isinstance(v, date) else v for k, v in record.items()})
+        return out.getvalue()
+
+    def to_json(self):
+        def default(value):
+            return value.isoformat() if isinstance(value, date) else str(value)
+
+        return json.dumps({
+            "title": self.title,
+            "grand_total": self.grand_total,
+            "subtotals": [total.subtotal if total.subtotal is not None else total.subtotal_text for total in self.totals],
+            "items": self.records(),
+        }, default=default, indent=2)
+
+    def to_xlsx(self):
+        """XLSX bytes; needs the optional openpyxl dependency (pip install budgetbox[xlsx])."""
+        try:
+            from openpyxl import Workbook
+        except ImportError as e:
+            raise ImportError("XLSX export needs openpyxl: pip install 'budgetbox[xlsx]'") from e
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = "Line items"
+        sheet.append(EXPORT_COLUMNS)
+        for record in self.records():
+            sheet.append([record[column] for column in EXPORT_COLUMNS])
+        for column in MONEY_COLUMNS:
+            letter = chr(ord("A") + EXPORT_COLUMNS.index(column))
+            for cell in sheet[letter][1:]:
+                cell.number_format = '"$"#,##0.00'
+        out = io.BytesIO()
+        workbook.save(out)
+        return out.getvalue()
+
+    def export(self, fmt):
+        """Bytes of the export in fmt ("csv", "json" or "xlsx")."""
+        if fmt == "xlsx":
+            return self.to_xlsx()
+        if fmt not in ("csv", "json"):
+            raise ValueError(f"Unknown export format {fmt!r}; expected csv, json or xlsx")
+        return (self.to_csv() if fmt == "csv" else self.to_json()).encode("utf-8")
+
+
+def build_line_items(tables_info, grand_total, proposal_title):
+    """Parses every table of an ExtractedProposal into ProposalLineItems, one column at a time."""
+    items, totals = [], []
+    for t_idx, (_, rows, links, total) in enumerate(tables_info):
+        columns = list(zip(*rows)) if rows else [()] * 7
+        descriptions = [plain_text(markup) for markup in columns[0]]
+        notes = [plain_text(markup) for markup in columns[6]]
+        parsed = {
+            "start_date": [parse_date(text) if text else None for text in columns[1]],
+            "end_date": [parse_date(text) if text else None for text in columns[2]],
+            "term_months": [parse_term(text) if text else None for text in columns[3]],
+            "monthly_amount": [parse_amount(text) if text else None for text in columns[4]],
+            "item_total": [parse_amount(text) if text else None for text in columns[5]],
+        }
+        raw = dict(zip(parsed, columns[1:6]))
+        for r_idx, row in enumerate(rows):
+            unparsed = {column: raw[column][r_idx] for column in parsed if raw[column][r_idx] and parsed[column][r_idx] is None}
+            items.append(LineItem(
+                t_idx, descriptions[r_idx], row[0],
+                parsed["start_date"][r_idx], parsed["end_date"][r_idx], parsed["term_months"][r_idx],
+                parsed["monthly_amount"][r_idx], parsed["item_total"][r_idx],
+                notes[r_idx], row[6], links[r_idx], unparsed or None,
+            ))
+        subtotal_text = total if isinstance(total, str) or total is None else " ".join(str(cell) for cell in total if cell)
+        totals.append(TableTotal(t_idx, parse_total(total), subtotal_text))
+    return ProposalLineItems(proposal_title, items, totals, parse_amount(grand_total) if grand_total else None)
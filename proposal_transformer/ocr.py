@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""OCR fallback for scanned pages: a searchable text layer the usual extraction runs on.
+
+A page with images but no fonts has no text layer. text_layer_source() rasterizes such
+pages with PyMuPDF at OCR_DPI and reads their word boxes with Tesseract (pytesseract),
+one page per worker process. Each word is written back onto its page as invisible text
+stretched to its box, in bold where its strokes are thick, and the ruling lines found
+in the image become vector lines. The backends, triage and the table, rich-cell and
+total logic then see an ordinary text PDF.
+
+Results are cached on disk (BUDGETBOX_OCR_CACHE_DIR) by a hash of the page image, so
+re-uploads never OCR the same page twice. BUDGETBOX_OCR_DPI trades accuracy for speed,
+BUDGETBOX_OCR_LANG picks the Tesseract language and BUDGETBOX_OCR=0 turns the stage off.
+The caller's page-worker count sets the number of OCR processes (BUDGETBOX_OCR_WORKERS
+caps it). pytesseract and the tesseract binary are optional; without them scanned
+pages are left as they are and counted as "pages_without_text", as is any page
+Tesseract fails on.
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+
+from proposal_transformer.assets import ASSET_CACHE_DIR
+from proposal_transformer.backends import is_pdf_path, open_fitz
+from proposal_transformer.cache import ResultCache
+from proposal_transformer.profiling import NULL_PROFILER
+
+OCR_ENABLED = os.environ.get("BUDGETBOX_OCR", "1") != "0"
+OCR_DPI = int(os.environ.get("BUDGETBOX_OCR_DPI", "300"))
+OCR_LANG = os.environ.get("BUDGETBOX_OCR_LANG", "eng")
+OCR_WORKERS = int(os.environ.get("BUDGETBOX_OCR_WORKERS", "0")) # Caps the caller's worker count; 0: no cap
+OCR_IMAGES_PER_WORKER = 2 # Page images queued per OCR worker; a 300-DPI letter page is about 8 MB
+OCR_CACHE_DIR = os.environ.get("BUDGETBOX_OCR_CACHE_DIR") or os.path.join(ASSET_CACHE_DIR, "ocr")
+OCR_CACHE_VERSION = 1 # Bump when OCR settings or output change, so old entries are not reused
+MIN_WORD_CONFIDENCE = 30 # Tesseract confidence (0-100); lower scores are mostly specks and picture texture
+DARK_LEVEL = 0x80 # Grey levels below this count as ink when looking for ruling lines
+RULE_MIN_INCHES = 0.3
+RULE_MAX_POINTS = 3 # Thicker dark bands are fills or pictures, not table rules
+BOLD_STROKE_RATIO = 1.3 # Strokes this much thicker than the page's median (relative to line height) read as bold
+BOLD_MIN_WORDS = 5
+TEXT_FONT = "helv"
+BOLD_TEXT_FONT = "hebo" # Helvetica-Bold, which rich_text reads as bold
+
+OcrWord = namedtuple("OcrWord", "x0 y0 x1 y1 text line bold") # Pixel box; line = (block, paragraph, line) numbers
+OcrRule = namedtuple("OcrRule", "horizontal pos start end") # Pixel centre line and extent
+OcrPage = namedtuple("OcrPage", "words rules")
+
+_cache = None
+
+
+@lru_cache(maxsize=None)
+def ocr_available():
+    if not OCR_ENABLED:
+        return False
+    try:
+        import pytesseract
+
+        pytesseract.get_tesseract_version()
+    except Exception: # Not installed, or the tesseract binary is missing
+        return False
+    return True
+
+
+def get_ocr_cache():
+    global _cache
+    if _cache is None:
+        _cache = ResultCache(memory_limit_bytes=32 * 1024 * 1024, disk_dir=OCR_CACHE_DIR, disk_limit_bytes=512 * 1024 * 1024)
+    return _cache
+
+
+def needs_ocr(page):
+    """True for pages without a text layer that have something to read: no fonts, some images."""
+    return not page.get_fonts() and bool(page.get_images())
+
+
+def image_key(samples, width, height, dpi):
+    digest = hashlib.sha256(samples)
+    digest.update(f"{width}x{height}-{dpi}-{OCR_LANG}-{MIN_WORD_CONFIDENCE}-v{OCR_CACHE_VERSION}".encode("ascii"))
+    return "ocr-" + digest.hexdigest()
+
+
+def ocr_words(samples, width, height, lang=OCR_LANG):
+    """Tesseract word boxes of a greyscale image, in pixels."""
+    import pytesseract
+    from PIL import Image
+
+    data = pytesseract.image_to_data(Image.frombytes("L", (width, height), samples), lang=lang, output_type=pytesseract.Output.DICT)
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = text.strip()
+        if not text or float(data["conf"][i]) < MIN_WORD_CONFIDENCE:
+            continue
+        left, top = data["left"][i], data["top"][i]
+        words.append(OcrWord(left, top, left + data["width"][i], top + data["height"][i], text,
+                             (data["block_num"][i], data["par_num"][i], data["line_num"][i]), False))
+    return words
+
+
+def mark_bold(words, samples, width):
+    """Sets OcrWord.bold from stroke thickness, which Tesseract does not report.
+
+    A word's stroke is its median horizontal run of ink (so the bars of 2, 7 or $ do not
+    count), taken relative to the height of its line so headings and body text compare fairly.
+    """
+    if len(words) < BOLD_MIN_WORDS:
+        return words
+    ink_run = re.compile(b"[\\x00-\\x%02x]+" % (DARK_LEVEL - 1))
+    line_heights = {}
+    for word in words:
+        top, bottom = line_heights.get(word.line, (word.y0, word.y1))
+        line_heights[word.line] = (min(top, word.y0), max(bottom, word.y1))
+    strokes = []
+    for word in words:
+        runs = [len(m.group()) for y in range(int(word.y0), int(word.y1))
+                for m in ink_run.finditer(samples, y * width + int(word.x0), y * width + int(word.x1))]
+        top, bottom = line_heights[word.line]
+        strokes.append(sorted(runs)[len(runs) // 2] / max(bottom - top, 1) if runs else 0.0)
+    median = sorted(strokes)[len(strokes) // 2]
+    return [word._replace(bold=stroke > BOLD_STROKE_RATIO * median) for word, stroke in zip(words, strokes)]
+
+
+def merge_runs(runs, horizontal, max_thickness):
+    """Joins runs on consecutive rows (or columns) with about the same extent into one rule each."""
+    rules, open_rules = [], [] # open_rules: [first pos, last pos, start, end]
+    for pos, start, end in runs: # Ordered by pos
+        for rule in open_rules:
+            if rule[1] == pos - 1 and abs(rule[2] - start) <= 2 and abs(rule[3] - end) <= 2:
+                rule[1] = pos
+                break
+        else:
+            open_rules.append([pos, pos, start, end])
+        if len(open_rules) > 64: # Close rules that can no longer grow
+            rules.extend(rule for rule in open_rules if rule[1] < pos - 1)
+            open_rules = [rule for rule in open_rules if rule[1] >= pos - 1]
+    rules.extend(open_rules)
+    return [OcrRule(horizontal, (first + last) / 2, start, end) for first, last, start, end in rules if last - first < max_thickness]
+
+
+def find_rules(samples, width, height, dpi):
+    """Horizontal and vertical ruling lines of a greyscale image, found as long runs of dark pixels."""
+    dark_run = re.compile(b"[\\x00-\\x%02x]{%d,}" % (DARK_LEVEL - 1, int(RULE_MIN_INCHES * dpi)))
+    max_thickness = max(1, int(RULE_MAX_POINTS * dpi / 72))
+    horizontal = [(y, m.start() - y * width, m.end() - y * width)
+                  for y in range(height) for m in dark_run.finditer(samples, y * width, (y + 1) * width)]
+    vertical = [(x, m.start(), m.end()) for x in range(width) for m in dark_run.finditer(samples[x::width])]
+    return merge_runs(horizontal, True, max_thickness) + merge_runs(vertical, False, max_thickness)
+
+
+def ocr_page_image(samples, width, height, dpi, lang=OCR_LANG):
+    """OcrPage for one page image; runs in a worker process."""
+    return OcrPage(mark_bold(ocr_words(samples, width, height, lang), samples, width), find_rules(samples, width, height, dpi))
+
+
+def write_text_layer(page, ocr_page, dpi):
+    """Adds the OCR words as invisible text, one font size per line, and the rules as thin lines."""
+    import fitz
+
+    scale = 72 / dpi
+    lines = {}
+    for word in ocr_page.words:
+        lines.setdefault(word.line, []).append(word)
+    shape = page.new_shape()
+    for words in lines.values():
+        baseline = max(word.y1 for word in words) * scale # A shared baseline and size keep the line together for pdfplumber
+        fontsize = max(1.0, (max(word.y1 for word in words) - min(word.y0 for word in words)) * scale)
+        for word in words:
+            origin = fitz.Point(word.x0 * scale, baseline)
+            fontname = BOLD_TEXT_FONT if word.bold else TEXT_FONT
+            natural_width = fitz.get_text_length(word.text, fontname=fontname, fontsize=fontsize)
+            stretch = (word.x1 - word.x0) * scale / natural_width if natural_width else 1.0
+            shape.insert_text(origin, word.text, fontsize=fontsize, fontname=fontname, render_mode=3,
+                              morph=(origin, fitz.Matrix(stretch, 1)))
+    for rule in ocr_page.rules:
+        pos, start, end = rule.pos * scale, rule.start * scale, rule.end * scale
+        if rule.horizontal:
+            shape.draw_line(fitz.Point(start, pos), fitz.Point(end, pos))
+        else:
+            shape.draw_line(fitz.Point(pos, start), fitz.Point(pos, end))
+        shape.finish(color=(0, 0, 0), width=0.5) # One path per rule: PyMuPDF groups table areas by path
+    shape.commit()
+
+
+def ocr_pages(doc, page_indexes, dpi=OCR_DPI, workers=1, profiler=NULL_PROFILER):
+    """Adds a text layer to page_indexes of an open fitz document; returns how many pages were OCR'd afresh.
+
+    Pages are rasterized one at a time and at most OCR_IMAGES_PER_WORKER images per worker
+    wait for Tesseract, so memory does not grow with the number of scanned pages. A page
+    Tesseract fails on keeps no text layer and is counted as "pages_without_text".
+    """
+    import fitz
+
+    cache = get_ocr_cache()
+    workers = min(workers, OCR_WORKERS) if OCR_WORKERS else workers
+    fresh = cached = failed = 0
+
+    def add_text_layer(page_index, ocr_page):
+        with profiler.stage("ocr_text_layer", page=page_index):
+            write_text_layer(doc[page_index], ocr_page, dpi)
+
+    def finish(page_index, key, get_ocr_page):
+        nonlocal fresh, failed
+        try:
+            ocr_page = get_ocr_page()
+        except Exception: # e.g. pytesseract.TesseractError; the other pages still get their text layer
+            failed += 1
+            return
+        cache.put(key, ocr_page)
+        fresh += 1
+        add_text_layer(page_index, ocr_page)
+
+    # spawn, as in parallel.py; one page per task since Tesseract takes seconds per page
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(page_indexes)), mp_context=multiprocessing.get_context("spawn")) \
+        if workers > 1 and len(page_indexes) > 1 else None
+    in_flight = {} # future -> (page index, cache key)
+    try:
+        with profiler.stage("ocr"):
+            for page_index in page_indexes:
+                page = doc[page_index]
+                if page.rotation:
+                    page.remove_rotation() # OCR and write the text layer in the page's upright coordinates
+                with profiler.stage("ocr_rasterize", page=page_index):
+                    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                    key = image_key(pix.samples, pix.width, pix.height, dpi)
+                    ocr_page = cache.get(key)
+                if ocr_page is not None:
+                    cached += 1
+                    add_text_layer(page_index, ocr_page)
+                elif pool is None:
+                    finish(page_index, key, lambda: ocr_page_image(pix.samples, pix.width, pix.height, dpi))
+                else:
+                    in_flight[pool.submit(ocr_page_image, pix.samples, pix.width, pix.height, dpi)] = (page_index, key)
+                    if len(in_flight) >= workers * OCR_IMAGES_PER_WORKER:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finish(*in_flight.pop(future), future.result)
+                del pix # Only the queued tasks hold page images
+            for future in list(in_flight):
+                finish(*in_flight.pop(future), future.result)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    profiler.count("pages_ocr_cached", cached)
+    profiler.count("pages_ocr", fresh)
+    profiler.count("pages_without_text", failed)
+    return fresh
+
+
+@contextmanager
+def text_layer_source(pdf_source, workers=1, profiler=NULL_PROFILER):
+    """Yields pdf_source, or a copy in which scanned pages carry an OCR text layer.
+
+    workers is the number of Tesseract processes, taken from the caller's page workers so
+    that a job in the JobQueue stays within its share of the CPUs.
+
+    The copy is bytes for bytes and a temporary file (deleted on exit) for a path, so
+    streaming mode stays on disk.
+    """
+    if not OCR_ENABLED:
+        yield pdf_source
+        return
+    with open_fitz(pdf_source) as doc:
+        with profiler.stage("ocr_scan"):
+            scanned = [page.number for page in doc if needs_ocr(page)]
+    if not scanned or not ocr_available():
+        profiler.count("pages_without_text", len(scanned))
+        yield pdf_source
+        return
+    with open_fitz(pdf_source) as doc:
+        ocr_pages(doc, scanned, workers=workers, profiler=profiler)
+        if is_pdf_path(pdf_source):
+            fd, ocr_source = tempfile.mkstemp(suffix=".pdf")
+            os.close(fd)
+            doc.save(ocr_source)
+        else:
+            ocr_source = doc.tobytes()
+    try:
+        yield ocr_source
+    finally:
+        if is_pdf_path(ocr_source):
+            try:
+                os.remove(ocr_source)
+            except OSError:
+                pass
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Process-pool extraction: contiguous page ranges go to workers that each open the PDF.
+
+Given a file path, workers open the file themselves instead of each receiving a copy of
+the PDF's bytes. Workers only run the per-page stage (extract_tables_from_page); totals matched from the
+page text are resolved afterwards by assemble_proposal, in page order, so the
+used-total-line bookkeeping behaves exactly as in the serial path.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from proposal_transformer.backends import open_fitz
+from proposal_transformer.extract import extract_page_range
+from proposal_transformer.profiling import NULL_PROFILER, Profiler
+
+PARALLEL_MIN_PAGES = 8 # Below this, pool start-up costs more than it saves
+PAGES_PER_CHUNK_MIN = 2
+
+_worker_pdf_source = None
+_worker_backend = None
+_worker_profile_options = None # Profiler(**options) per chunk when the caller is profiling
+_worker_strict = False
+
+
+def default_workers():
+    return int(os.environ.get("BUDGETBOX_WORKERS", "0")) or max(1, (os.cpu_count() or 1) - 1)
+
+
+def count_pages(pdf_source):
+    with open_fitz(pdf_source) as doc:
+        return doc.page_count
+
+
+def page_chunks(page_count, workers):
+    # About two chunks per worker keeps workers busy when some pages are much slower than others
+    chunk_size = max(PAGES_PER_CHUNK_MIN, -(-page_count // (workers * 2)))
+    return [range(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+
+def _init_worker(pdf_source, backend, profile_options, strict):
+    global _worker_pdf_source, _worker_backend, _worker_profile_options, _worker_strict
+    _worker_pdf_source, _worker_backend, _worker_profile_options, _worker_strict = pdf_source, backend, profile_options, strict
+
+
+def _extract_chunk(page_numbers):
+    """Returns (page results, exported profile or None) for one chunk."""
+    if _worker_profile_options is None:
+        return extract_page_range(_worker_pdf_source, _worker_backend, page_numbers, strict=_worker_strict), None
+    with Profiler(**_worker_profile_options) as profiler:
+        page_results = extract_page_range(_worker_pdf_source, _worker_backend, page_numbers, profiler, _worker_strict)
+    return page_results, profiler.to_dict()
+
+
+def extract_pages_parallel(pdf_source, backend, workers, page_count, profiler=NULL_PROFILER, strict=False):
+    """Returns the same [(page index, page text, page tables)] list as extract_page_range."""
+    chunks = page_chunks(page_count, workers)
+    profile_options = None
+    if profiler.enabled:
+        profile_options = {"trace_memory": profiler.trace_memory, "profile_slowest_page": profiler.profile_slowest_page}
+    # spawn, not fork: the parent may be a threaded Streamlit server holding open MuPDF documents
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(pdf_source, backend, profile_options, strict)) as pool:
+        futures = [pool.submit(_extract_chunk, chunk) for chunk in chunks]
+        page_results = []
+        try:
+            for future in futures: # Chunk (and so page) order
+                chunk_results, chunk_profile = future.result()
+                page_results.extend(chunk_results)
+                if chunk_profile:
+                    profiler.merge(chunk_profile)
+                else:
+                    # Progress for job reporters, which also check for cancellation here; merge() counts profiled pages
+                    profiler.count("pages", len(chunk_results))
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True) # Only the chunks already running are finished
+            raise
+    return page_results
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Headless entry points: extract(pdf_bytes) -> ExtractedProposal, render(model) -> PDF bytes.
+
+Streaming mode: pass a file path instead of bytes to extract() and an output_path to
+render(). The parsers then read the PDF from disk and the output is written to disk,
+so neither PDF is held in memory as bytes. spool_upload() writes an uploaded file
+object to such a path.
+"""
+import os
+import shutil
+import tempfile
+
+from proposal_transformer.backends import DEFAULT_BACKEND
+from proposal_transformer.extract import extract_proposal
+from proposal_transformer.profiling import NULL_PROFILER
+
+
+class NothingToReformatError(ValueError):
+    """Raised by convert() when a PDF has neither tables nor a grand total to lay out."""
+
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+def extract(pdf_source, backend=DEFAULT_BACKEND, workers=1, profiler=NULL_PROFILER, strict=False):
+    """pdf_source is the PDF's bytes or a path to it."""
+    return extract_proposal(pdf_source, backend=backend, workers=workers, profiler=profiler, strict=strict)
+
+
+def render(model, on_warning=None, profiler=NULL_PROFILER, fast=None, on_progress=None, output_path=None,
+           options=None, flowable_cache=None):
+    """Returns the PDF bytes, or writes them to output_path and returns output_path.
+
+    options (a RenderOptions) changes the title, page size, column widths or logo. Passing
+    the same render.FlowableCache to later calls reuses the tables built by earlier ones.
+    """
+    from proposal_transformer.render import render_proposal # reportlab, PIL and fonts load on first render
+
+    return render_proposal(model.tables_info, model.grand_total, model.proposal_title, on_warning=on_warning,
+                           profiler=profiler, fast=fast, on_progress=on_progress, output_path=output_path,
+                           options=options, flowable_cache=flowable_cache)
+
+
+def spool_upload(fileobj, path=None):
+    """Copies an uploaded file object to path (a new temporary .pdf when None) in chunks and
+    returns the path. The caller deletes the file once extraction is done."""
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, f, SPOOL_CHUNK_BYTES)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return path
+
+
+def ensure_reformattable(model):
+    if not model.tables_info and not model.grand_total:
+        raise NothingToReformatError("No tables or grand total suitable for reformatting were found.")
+    return model
+
+
+def convert(pdf_source, backend=DEFAULT_BACKEND, workers=1, on_warning=None, profiler=NULL_PROFILER, strict=False, output_path=None):
+    """extract() then render(); raises NothingToReformatError when there is nothing to lay out."""
+    model = ensure_reformattable(extract(pdf_source, backend=backend, workers=workers, profiler=profiler, strict=strict))
+    return render(model, on_warning=on_warning, profiler=profiler, output_path=output_path)
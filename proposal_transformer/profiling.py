@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Per-stage and per-page timing, CPU and peak-memory instrumentation.
+
+Pipeline code calls profiler.stage("name", page=...) and profiler.count("name"); the
+default NULL_PROFILER makes both free. A Profiler records wall time, CPU time and the
+tracemalloc peak (bytes above the stage's starting allocation) of every stage run, and
+can keep a cProfile capture of the slowest page.
+"""
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+class NullProfiler:
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    @contextmanager
+    def stage(self, name, page=None):
+        yield {}
+
+    def count(self, name, n=1):
+        pass
+
+    def merge(self, profile):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, trace_memory=True, profile_slowest_page=False):
+        self.trace_memory = trace_memory
+        self.profile_slowest_page = profile_slowest_page
+        self.records = [] # One dict per finished stage run, in completion order
+        self.counters = Counter()
+        self.slowest_page = None # {"page", "wall", "stats"} once profile_slowest_page has data
+        self._stack = [] # Open stages: [start traced bytes, highest peak seen before a child reset it]
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, page=None):
+        record = {"stage": name, "page": page}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack: # Remember the parent's peak so far; reset_peak() below would lose it
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, 0])
+        profile = cProfile.Profile() if self.profile_slowest_page and name == "page" else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+            record["wall"] = time.perf_counter() - wall_start
+            record["cpu"] = time.process_time() - cpu_start
+            if tracing:
+                start_current, child_peak = self._stack.pop()
+                absolute_peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+                record["peak_bytes"] = max(0, absolute_peak - start_current)
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], absolute_peak)
+            self.records.append(record)
+            if profile and (self.slowest_page is None or record["wall"] > self.slowest_page["wall"]):
+                self.slowest_page = {"page": record["page"], "wall": record["wall"], "stats": self._format_stats(profile)}
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @staticmethod
+    def _format_stats(profile, limit=40):
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def merge(self, profile):
+        """Adds records exported by to_dict() in another process (see parallel.py)."""
+        self.records.extend(profile["records"])
+        self.counters.update(profile["counters"])
+        other_slowest = profile.get("slowest_page")
+        if other_slowest and (self.slowest_page is None or other_slowest["wall"] > self.slowest_page["wall"]):
+            self.slowest_page = other_slowest
+
+    def stage_summary(self):
+        """Aggregates records by stage: runs, total wall and CPU seconds, largest peak."""
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record["stage"], {"stage": record["stage"], "runs": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+            entry["runs"] += 1
+            entry["wall"] += record["wall"]
+            entry["cpu"] += record["cpu"]
+            entry["peak_bytes"] = max(entry["peak_bytes"], record.get("peak_bytes", 0))
+        return sorted(summary.values(), key=lambda entry: entry["wall"], reverse=True)
+
+    def page_records(self):
+        return sorted((r for r in self.records if r["stage"] == "page"), key=lambda r: r["page"] if r["page"] is not None else -1)
+
+    def to_dict(self):
+        return {
+            "stages": self.stage_summary(),
+            "pages": self.page_records(),
+            "counters": dict(self.counters),
+            "records": self.records,
+            "slowest_page": self.slowest_page,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
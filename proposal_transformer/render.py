@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""ReportLab rendering of extracted proposal tables into the landscape output PDF.
+
+Imported on first render only; fonts are registered and styles built once per process.
+
+The default "fast" mode draws cells without markup as plain strings with table-level
+font and alignment styles and keeps Paragraph for rich Description/Notes text only.
+It also lays tables out RENDER_CHUNK_ROWS rows at a time (see ChunkedTable), so
+doc.build time grows linearly with the row count. BUDGETBOX_RENDER_MODE=paragraph
+selects the original layout, in which every cell is a Paragraph.
+
+Title, page size, column widths and logo come from layout.RenderOptions. A
+FlowableCache passed to render_proposal keeps each table's parsed cells (TableCells)
+between renders. Re-rendering a model with new options then parses only the tables
+whose content changed; new column widths or a new page width rebreak the cached
+Paragraphs, and a new title, page height or logo reuses the measured rows as well.
+"""
+import hashlib
+import io
+import os
+import re
+import html 
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer, Image as RLImage
+from reportlab.platypus.flowables import Flowable
+
+from proposal_transformer.assets import LogoAsset, get_logo, logo_error
+from proposal_transformer.extract import HEADERS
+from proposal_transformer.layout import RenderOptions, page_size_inches
+from proposal_transformer.profiling import NULL_PROFILER
+
+# Fonts ship inside the package (proposal_transformer/fonts); BUDGETBOX_FONTS_DIR points elsewhere
+FONTS_DIR = os.environ.get("BUDGETBOX_FONTS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# --- Font Registration ---
+pdfmetrics.registerFont(TTFont("DMSerif", os.path.join(FONTS_DIR, "DMSerifDisplay-Regular.ttf")))
+pdfmetrics.registerFont(TTFont("Barlow", os.path.join(FONTS_DIR, "Barlow-Regular.ttf")))
+
+BARLOW_BOLD_LOADED = False
+try:
+    pdfmetrics.registerFont(TTFont("Barlow-Bold", os.path.join(FONTS_DIR, "Barlow-Bold.ttf")))
+    pdfmetrics.registerFontFamily('Barlow', normal='Barlow', bold='Barlow-Bold')
+    BARLOW_BOLD_LOADED = True
+except Exception:
+    # Silently pass if bold font is not found; extract_rich_cell will still add <b> tags
+    # ReportLab will then handle rendering based on available fonts for the family
+    pass
+
+DEFAULT_SERIF_FONT = "DMSerif"
+DEFAULT_SANS_FONT = "Barlow"
+
+# --- Styles (built once per process, shared by every render) ---
+ts = ParagraphStyle("Title", fontName=DEFAULT_SERIF_FONT, fontSize=18, alignment=TA_CENTER, spaceAfter=12)
+hs = ParagraphStyle("Header", fontName=DEFAULT_SERIF_FONT, fontSize=10, alignment=TA_CENTER, textColor=colors.black, spaceAfter=6)
+bs = ParagraphStyle("Body", fontName=DEFAULT_SANS_FONT, fontSize=9, alignment=TA_LEFT, leading=12)
+bs_right = ParagraphStyle("BodyRight", parent=bs, alignment=TA_RIGHT)
+bs_center = ParagraphStyle("BodyCenter", parent=bs, alignment=TA_CENTER)
+body_styles = [bs, bs_center, bs_center, bs_center, bs_right, bs_right, bs]
+BOLD_SANS_FONT = "Barlow-Bold" if BARLOW_BOLD_LOADED else DEFAULT_SANS_FONT
+
+RENDER_MODE = os.environ.get("BUDGETBOX_RENDER_MODE", "fast") # "fast" or "paragraph"
+RENDER_CHUNK_ROWS = int(os.environ.get("BUDGETBOX_RENDER_CHUNK_ROWS", "100"))
+CELL_H_PADDING = 12 # ReportLab's default LEFTPADDING + RIGHTPADDING
+COLUMN_ALIGNMENTS = {1: "CENTER", 2: "CENTER", 3: "CENTER", 4: "RIGHT", 5: "RIGHT"}
+
+# --- Table Building Blocks ---
+def total_row_text(current_total_info):
+    """(label, value) for a total row taken from table cells or from a find_total line."""
+    total_label_text, total_value_text = "Total", ""
+    if isinstance(current_total_info, list): # From table cell directly
+        total_label_text = next((c for c in current_total_info if c and '$' not in c and c.strip().lower() not in ["total", "subtotal"]), None)
+        if not total_label_text or total_label_text.lower() == "total":
+             total_label_text = next((c for c in current_total_info if c and ('total' in c.lower() or 'subtotal' in c.lower())), "Total").strip()
+        else: total_label_text = total_label_text.strip()
+        total_value_text = next((c for c in reversed(current_total_info) if "$" in c), "")
+    elif isinstance(current_total_info, str): # From find_total
+        m_total = re.match(r'(.*?)\s*(\$\s*[\d,]+(?:\.\d{2})?)', current_total_info) # Allow cents to be optional in match for parsing
+        if m_total: 
+            total_label_text, total_value_text = m_total.group(1).strip(), m_total.group(2).strip()
+        else:
+            total_label_text = re.sub(r'\$\s*[\d,.]+', '', current_total_info).strip() or "Total"
+            val_match = re.search(r'(\$\s*[\d,]+(?:\.\d{1,2})?)', current_total_info) # Allow cents optional
+            if val_match: total_value_text = val_match.group(1)
+    if not total_label_text: total_label_text = "Total"
+    return total_label_text, total_value_text
+
+
+def table_style_commands(n_cols, header_rows, data_rows, has_total_row):
+    """LongTable style for header_rows (0 or 1) + data_rows + an optional total row."""
+    style_cmds_list = [("GRID", (0, 0), (-1, -1), 0.25, colors.grey)]
+    if header_rows:
+        style_cmds_list.extend([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#F2F2F2")), # Header
+            ("VALIGN", (0, 0), (-1, 0), "MIDDLE"),
+        ])
+    style_cmds_list.append(("VALIGN", (0, header_rows), (-1, -1), "TOP"))
+    if data_rows > 0:
+        first_data_row, last_data_row = header_rows, header_rows + data_rows - 1
+        # Plain-string cells take their font from the table; Paragraph cells ignore these
+        style_cmds_list.extend([
+            ("FONTNAME", (0, first_data_row), (-1, last_data_row), DEFAULT_SANS_FONT),
+            ("FONTSIZE", (0, first_data_row), (-1, last_data_row), bs.fontSize),
+            ("LEADING", (0, first_data_row), (-1, last_data_row), bs.leading),
+        ])
+        for col_idx_align, align_type in COLUMN_ALIGNMENTS.items():
+            if col_idx_align < n_cols:
+                style_cmds_list.append(("ALIGN", (col_idx_align, first_data_row), (col_idx_align, last_data_row), align_type))
+    if has_total_row: # Styles for the total row (which is the last row: -1)
+        style_cmds_list.extend([
+            ("SPAN", (0, -1), (-2, -1)), 
+            ("ALIGN", (0, -1), (-2, -1), "LEFT"), # Total label: where a full-width Paragraph draws it
+            ("ALIGN", (-1, -1), (-1, -1), "RIGHT"), # Total value alignment
+            ("VALIGN", (0, -1), (-1, -1), "MIDDLE"),
+            ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#EAEAEA")), # Total row background
+            ("FONTNAME", (0, -1), (-1, -1), BOLD_SANS_FONT),
+            ("FONTSIZE", (0, -1), (-1, -1), bs.fontSize),
+            ("LEADING", (0, -1), (-1, -1), bs.leading),
+        ])
+    return style_cmds_list
+
+
+def plain_text_width(text):
+    """(text as a plain string, its width) when a Paragraph would draw it unchanged on one line; None for markup."""
+    if "<" in text or ">" in text or "&" in text:
+        return None
+    plain = " ".join(text.split()) # Paragraph collapses whitespace the same way
+    return plain, pdfmetrics.stringWidth(plain, DEFAULT_SANS_FONT, bs.fontSize)
+
+
+class MeasuredParagraph(Paragraph):
+    """A Paragraph that breaks its lines once per width: ChunkedTable measures, the table draws.
+
+    The line breaks of the last few widths are kept, so a cached cell (see TableCells)
+    switched back to an earlier column width is not broken again.
+    """
+
+    MAX_WIDTHS = 4
+    _wrapped_width = None
+    _line_breaks = None # width -> (width, height, blPara, _wrapWidths) as set by Paragraph.wrap
+
+    def wrap(self, availWidth, availHeight):
+        if availWidth != self._wrapped_width:
+            if self._line_breaks is None:
+                self._line_breaks = {}
+            state = self._line_breaks.get(availWidth)
+            if state is None:
+                Paragraph.wrap(self, availWidth, availHeight)
+                if len(self._line_breaks) >= self.MAX_WIDTHS:
+                    self._line_breaks.clear()
+                state = self._line_breaks[availWidth] = (self.width, self.height, self.blPara, self._wrapWidths)
+            else:
+                self.width, self.height, self.blPara, self._wrapWidths = state
+            self._wrapped_width = availWidth
+        return self.width, self.height
+
+
+class ChunkedTable(Flowable):
+    """A long table that measures its rows once and is laid out one page at a time.
+
+    LongTable re-measures the remaining rows every time it splits at a page break, so a
+    table with thousands of Paragraph cells costs quadratic time. Here row heights are
+    measured once, lazily, RENDER_CHUNK_ROWS rows at a time. Each page then gets a
+    LongTable holding exactly the rows that fit, with explicit row heights, so ReportLab
+    never measures a cell a second time. As with LongTable(repeatRows=1), every page
+    the table spans starts with the header row.
+    """
+
+    def __init__(self, header_row, body_rows, col_widths, has_total_row, layout=None, start=0):
+        Flowable.__init__(self)
+        self.header_row, self.body_rows, self.col_widths = header_row, body_rows, col_widths
+        self.has_total_row, self.start = has_total_row, start
+        self.layout = layout if layout is not None else {"heights": [], "header_height": None} # Shared by all pieces
+        self._piece = None
+
+    def _cell_height(self, value, width, style_leading):
+        if isinstance(value, Flowable):
+            return value.wrap(width - CELL_H_PADDING, 1e6)[1] + 6 # + TOPPADDING + BOTTOMPADDING
+        return style_leading * len(str(value).split("\n")) + 6
+
+    def _row_height(self, row_idx):
+        heights = self.layout["heights"]
+        while row_idx >= len(heights): # Measure the next fixed-size chunk
+            for row in self.body_rows[len(heights):len(heights) + RENDER_CHUNK_ROWS]:
+                heights.append(max(self._cell_height(v, w, bs.leading) for v, w in zip(row, self.col_widths)))
+        return heights[row_idx]
+
+    def _header(self):
+        header = self.header_row()
+        if self.layout["header_height"] is None:
+            self.layout["header_height"] = max(self._cell_height(v, w, bs.leading) for v, w in zip(header, self.col_widths))
+        return header
+
+    def _fit(self, availHeight):
+        """(rows that fit from self.start, their total height including the header)."""
+        header = self._header()
+        height = self.layout["header_height"]
+        end = self.start
+        while end < len(self.body_rows) and height + self._row_height(end) <= availHeight:
+            height += self._row_height(end)
+            end += 1
+        return header, end, height
+
+    def _make_piece(self, header, end):
+        rows = self.body_rows[self.start:end]
+        total_in_piece = self.has_total_row and end == len(self.body_rows)
+        piece = LongTable(
+            [header] + rows, colWidths=self.col_widths, repeatRows=1, # Never split; marks the header row as such
+            rowHeights=[self.layout["header_height"]] + self.layout["heights"][self.start:end],
+        )
+        piece.setStyle(TableStyle(table_style_commands(len(self.col_widths), 1, len(rows) - int(total_in_piece), total_in_piece)))
+        return piece
+
+    def wrap(self, availWidth, availHeight):
+        header, end, height = self._fit(availHeight)
+        self.width = sum(self.col_widths)
+        if end < len(self.body_rows):
+            self._piece, self.height = None, max(height, availHeight) + 1 # Does not fit: make the frame call split()
+        else:
+            self._piece, self.height = self._make_piece(header, end), height
+            self._piece.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        header, end, _ = self._fit(availHeight)
+        if end == self.start:
+            return [] # Not even one row fits: ReportLab moves the table to the next page
+        rest = [ChunkedTable(self.header_row, self.body_rows, self.col_widths, self.has_total_row, self.layout, end)] if end < len(self.body_rows) else []
+        return [self._make_piece(header, end)] + rest
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self._piece.drawOn(canvas, x, y, _sW)
+
+
+class TableCells:
+    """One table's cells, parsed once and laid out at any column widths.
+
+    Markup is parsed into Paragraphs and plain cells are measured once per table, so a
+    change of column widths or page size only rebreaks lines and re-measures row heights.
+    The cells and row heights of the last few column widths are kept as well.
+    """
+
+    MAX_LAYOUTS = 4
+
+    def __init__(self, table_info, fast):
+        current_headers, current_rows, current_links, current_total_info = table_info
+        self.fast = fast
+        self.n_cols = len(current_headers)
+        paragraph_class = MeasuredParagraph if fast else Paragraph
+        self.header = [paragraph_class(h_text, hs) for h_text in current_headers] # Drawn again on every page
+        self.texts = []
+        for i, row_data_list in enumerate(current_rows):
+            row_texts = []
+            for j, cell_text_val in enumerate(row_data_list):
+                text_to_render = cell_text_val
+                if j == 0 and i < len(current_links) and current_links[i]: # Link for description column
+                    text_to_render += f" <link href='{current_links[i]}' color='blue'>[link]</link>"
+                row_texts.append(text_to_render)
+            self.texts.append(row_texts)
+        self.plain = {} # (row, column) -> (plain text, width); drawn as a string where it fits its column
+        if fast:
+            for i, row_texts in enumerate(self.texts):
+                for j, text_to_render in enumerate(row_texts[:self.n_cols]):
+                    plain = plain_text_width(text_to_render)
+                    if plain is not None:
+                        self.plain[i, j] = plain
+        self.paragraphs = {} # (row, column) -> Paragraph, made the first time a layout needs it
+        self.total_row = None
+        if current_total_info:
+            total_label_text, total_value_text = total_row_text(current_total_info)
+            if fast:
+                self.total_row = [total_label_text] + [""] * (self.n_cols - 2) + [total_value_text]
+            else:
+                self.total_row = [Paragraph(f"<b>{total_label_text}</b>", bs)] + [Paragraph("<b></b>", bs)] * (self.n_cols - 2) + [Paragraph(f"<b>{total_value_text}</b>", bs_right)]
+        self.layouts = OrderedDict() # column widths -> (cell values, ChunkedTable layout)
+
+    def paragraph(self, i, j):
+        cell = self.paragraphs.get((i, j))
+        if cell is None:
+            paragraph_class = MeasuredParagraph if self.fast else Paragraph
+            cell = self.paragraphs[i, j] = paragraph_class(self.texts[i][j], body_styles[j] if j < len(body_styles) else bs)
+        return cell
+
+    def rows(self, col_widths):
+        """(cell values of the body rows and total row, row-height layout) at col_widths."""
+        key = tuple(col_widths)
+        if key in self.layouts:
+            self.layouts.move_to_end(key)
+            return self.layouts[key]
+        table_data_styled = []
+        for i, row_texts in enumerate(self.texts):
+            styled_row_elements = []
+            for j in range(len(row_texts)):
+                plain = self.plain.get((i, j))
+                if plain is not None and plain[1] <= col_widths[j] - CELL_H_PADDING:
+                    styled_row_elements.append(plain[0])
+                else:
+                    styled_row_elements.append(self.paragraph(i, j))
+            table_data_styled.append(styled_row_elements)
+        if self.total_row is not None:
+            table_data_styled.append(self.total_row)
+        self.layouts[key] = (table_data_styled, {"heights": [], "header_height": None})
+        while len(self.layouts) > self.MAX_LAYOUTS:
+            self.layouts.popitem(last=False)
+        return self.layouts[key]
+
+
+def table_digest(table_info):
+    return hashlib.sha1(repr(table_info).encode("utf-8")).hexdigest()
+
+
+class FlowableCache:
+    """TableCells reused by later renders (LRU, by table count).
+
+    Keys are a table's content digest and the render mode. The cached Paragraphs are laid
+    out in place during doc.build, so a cache must not be shared by renders running at
+    the same time; keep one per user session.
+    """
+
+    def __init__(self, max_tables=256):
+        self.max_tables = max_tables
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_tables:
+                self._entries.popitem(last=False)
+
+
+@lru_cache(maxsize=4)
+def custom_logo(data):
+    return LogoAsset(data)
+
+
+# --- PDF Generation ---
+def table_rows_drawn(flowable):
+    """Body rows (total rows included) in a table or table piece ReportLab just drew; 0 for anything else."""
+    if isinstance(flowable, ChunkedTable):
+        flowable = flowable._piece
+    if not isinstance(flowable, LongTable):
+        return 0
+    return len(flowable._cellvalues) - flowable.repeatRows
+
+
+def render_proposal(tables_info, grand_total, proposal_title, on_warning=None, profiler=NULL_PROFILER, fast=None, on_progress=None,
+                    output_path=None, options=None, flowable_cache=None):
+    """Lays out the extracted tables with ReportLab and returns the PDF bytes, or writes
+    them to output_path and returns output_path.
+
+    Problems that do not stop the build (such as a missing logo) are passed to on_warning.
+    fast selects the plain-string, chunked layout; None means RENDER_MODE decides.
+    on_progress(fraction) is called as table rows are drawn during doc.build.
+    options is a layout.RenderOptions (None for the defaults); flowable_cache a FlowableCache.
+    """
+    fast = RENDER_MODE == "fast" if fast is None else fast
+    options = options or RenderOptions()
+    on_warning = on_warning or (lambda message: None)
+    page_width, page_height = page_size_inches(options.page_size)
+    pdf_buf = io.BytesIO() if output_path is None else None
+    doc = SimpleDocTemplate(output_path or pdf_buf, pagesize=landscape((page_width * inch, page_height * inch)),
+                            leftMargin=0.5 * inch, rightMargin=0.5 * inch,
+                            topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+
+    with profiler.stage("render_story"):
+        story = []
+        logo_added_flag = False
+
+        logo = None
+        if options.logo:
+            try:
+                logo = custom_logo(options.logo)
+            except Exception as e:
+                on_warning(f"The logo image could not be read ({e}); rendering without it.")
+        elif options.logo is None:
+            logo = get_logo() # Never waits on the network; a missing logo is fetched in the background
+            if logo is None:
+                on_warning(logo_error() or "The logo is still being downloaded; it will appear in later conversions.")
+        if logo is not None:
+            reportlab_width, reportlab_height = logo.reportlab_size(min(5 * inch, doc.width - 1*inch))
+            story.append(RLImage(io.BytesIO(logo.data), width=reportlab_width, height=reportlab_height, hAlign='CENTER'))
+            logo_added_flag = True
+
+        if logo_added_flag: story.append(Spacer(1, 0.25*inch))
+        story.append(Paragraph(html.escape(options.title or proposal_title), ts)) # Use html.escape for title
+        story.append(Spacer(1, 24))
+
+        table_width = doc.width
+        main_col_widths = [table_width * fraction for fraction in options.column_widths]
+        for table_info in tables_info:
+            current_headers, current_rows, current_links, current_total_info = table_info
+            n_cols = len(current_headers)
+            current_col_widths_val = main_col_widths[:n_cols] if len(main_col_widths) >= n_cols else [table_width / n_cols] * n_cols
+            cache_key = (table_digest(table_info), fast)
+            cells = flowable_cache.get(cache_key) if flowable_cache is not None else None
+            if cells is None:
+                cells = TableCells(table_info, fast)
+                if flowable_cache is not None:
+                    flowable_cache.put(cache_key, cells)
+            else:
+                profiler.count("tables_from_cache")
+            table_data_styled, layout = cells.rows(current_col_widths_val)
+
+            def header_row(header=cells.header):
+                return header
+
+            num_data_rows = len(table_data_styled) - (1 if current_total_info else 0)
+            if fast:
+                tbl_reportlab = ChunkedTable(header_row, table_data_styled, current_col_widths_val, bool(current_total_info), layout)
+            else:
+                tbl_reportlab = LongTable([header_row()] + table_data_styled, colWidths=current_col_widths_val, repeatRows=1)
+                tbl_reportlab.setStyle(TableStyle(table_style_commands(n_cols, 1, num_data_rows, bool(current_total_info))))
+            story.extend([tbl_reportlab, Spacer(1, 24)])
+
+        if grand_total:
+            grand_total_cells = (
+                ["Grand Total"] + [""] * (len(HEADERS) - 2) + [grand_total] if fast else
+                [Paragraph("<b>Grand Total</b>", bs)] + [Paragraph("<b></b>", bs)] * (len(HEADERS) - 2) + [Paragraph(f"<b>{grand_total}</b>", bs_right)]
+            )
+            story.append(
+                LongTable([grand_total_cells],
+                          colWidths=main_col_widths,
+                          style=TableStyle([
+                              ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#D0D0D0")),
+                              ("GRID", (0, 0), (-1, -1), 0.25, colors.black),
+                              ("VALIGN", (0, 0), (-1, -1), "MIDDLE"), ("SPAN", (0, 0), (-2, 0)),
+                              ("ALIGN", (0, 0), (-2, 0), "LEFT"), ("ALIGN", (-1, 0), (-1, 0), "RIGHT"),
+                              ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                              ("FONTNAME", (0, 0), (-1, -1), BOLD_SANS_FONT if fast else DEFAULT_SANS_FONT),
+                              ("FONTSIZE", (0, 0), (-1, -1), bs.fontSize if fast else 10),
+                              ("LEADING", (0, 0), (-1, -1), bs.leading),
+                          ]))
+            )
+
+    profiler.count("rendered_rows", sum(len(rows) for _, rows, _, _ in tables_info))
+    if on_progress:
+        rows_to_draw = sum(len(rows) + (1 if total else 0) for _, rows, _, total in tables_info) + (1 if grand_total else 0)
+        rows_drawn = [0]
+
+        def after_flowable(flowable):
+            rows_drawn[0] += table_rows_drawn(flowable)
+            on_progress(min(1.0, rows_drawn[0] / max(rows_to_draw, 1)))
+
+        doc.afterFlowable = after_flowable
+    with profiler.stage("doc_build"):
+        doc.build(story)
+    return output_path if pdf_buf is None else pdf_buf.getvalue()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Rich-text (bold-aware) cell extraction from PyMuPDF text spans."""
+
+
+BOLD_FONT_MARKERS = ["bold", "demibold", "semibold", "heavy", "black"]
+SPAN_GRID_SIZE = 24.0 # Height in points of one bucket of the per-page span grid
+
+
+class PageSpanIndex:
+    """Spatial index over the characters of one page, built from a single rawdict extraction.
+
+    Cell lookups return what page.get_text("dict", clip=bbox) returns. When every character
+    near the cell lies either wholly inside or wholly outside it, which is the case for the
+    cells of a ruled table, each span is cut down to the characters inside and its text, bbox
+    and origin are rebuilt from them. MuPDF decides on glyph outlines that rawdict does not
+    expose, so a cell whose edge cuts through a character is read with a clipped get_text.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.spans = [] # (escaped chars, char bboxes, char origins, is_bold) in document order
+        self.grid = {} # y-bucket -> list of span ids
+        d = page.get_text("rawdict")
+        for block in d.get("blocks", []):
+            if block.get("type") != 0: # Text blocks only
+                continue
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    chars = span.get("chars", [])
+                    if not chars:
+                        continue
+                    font_name_from_span = span.get("font", "").lower()
+                    is_bold = any(b_str in font_name_from_span for b_str in BOLD_FONT_MARKERS) or bool(span["flags"] & 2)
+                    span_id = len(self.spans)
+                    self.spans.append((
+                        [ch["c"].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") for ch in chars],
+                        [ch["bbox"] for ch in chars],
+                        [ch["origin"] for ch in chars],
+                        is_bold,
+                    ))
+                    sy0, sy1 = span["bbox"][1], span["bbox"][3]
+                    for bucket in range(int(sy0 // SPAN_GRID_SIZE), int(sy1 // SPAN_GRID_SIZE) + 1):
+                        self.grid.setdefault(bucket, []).append(span_id)
+
+    def query(self, bbox):
+        """Returns (escaped text, bbox, origin, is_bold) for every span clipped to bbox."""
+        x0_bbox, y0_bbox, x1_bbox, y1_bbox = bbox
+        candidate_ids = set()
+        for bucket in range(int(y0_bbox // SPAN_GRID_SIZE), int(y1_bbox // SPAN_GRID_SIZE) + 1):
+            candidate_ids.update(self.grid.get(bucket, ()))
+
+        clipped_spans = []
+        for span_id in sorted(candidate_ids): # Keep document order
+            texts, char_bboxes, origins, is_bold = self.spans[span_id]
+            kept = [i for i, (cx0, cy0, cx1, cy1) in enumerate(char_bboxes)
+                    if cx0 < x1_bbox and cx1 > x0_bbox and cy0 < y1_bbox and cy1 > y0_bbox]
+            if any(not (char_bboxes[i][0] >= x0_bbox and char_bboxes[i][1] >= y0_bbox
+                        and char_bboxes[i][2] <= x1_bbox and char_bboxes[i][3] <= y1_bbox) for i in kept):
+                return self._clip_query(bbox) # The edge cuts a character; let MuPDF decide
+            if not kept:
+                continue
+            sx0 = min(char_bboxes[i][0] for i in kept)
+            sy0 = min(char_bboxes[i][1] for i in kept)
+            sx1 = max(char_bboxes[i][2] for i in kept)
+            sy1 = max(char_bboxes[i][3] for i in kept)
+            # Check for overlap
+            if sx0 < x1_bbox and sx1 > x0_bbox and sy0 < y1_bbox and sy1 > y0_bbox:
+                clipped_spans.append(("".join(texts[i] for i in kept), (sx0, sy0, sx1, sy1), origins[kept[0]], is_bold))
+        return clipped_spans
+
+    def _clip_query(self, bbox):
+        x0_bbox, y0_bbox, x1_bbox, y1_bbox = bbox
+        clipped_spans = []
+        d = self.page.get_text("dict", clip=bbox)
+        for block in d.get("blocks", []):
+            if block.get("type") != 0:
+                continue
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    sx0, sy0, sx1, sy1 = span["bbox"]
+                    if sx0 < x1_bbox and sx1 > x0_bbox and sy0 < y1_bbox and sy1 > y0_bbox:
+                        font_name_from_span = span.get("font", "").lower()
+                        is_bold = any(b_str in font_name_from_span for b_str in BOLD_FONT_MARKERS) or bool(span["flags"] & 2)
+                        text = span["text"].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+                        clipped_spans.append((text, tuple(span["bbox"]), span["origin"], is_bold))
+        return clipped_spans
+
+
+def extract_rich_cell(span_index, bbox):
+    try:
+        spans = span_index.query(bbox)
+        if not spans:
+            return ""
+
+        lines_dict = {}
+        for s_item in spans:
+            key = round(s_item[2][1], 1) # Group by y-origin
+            lines_dict.setdefault(key, []).append(s_item)
+
+        span_text_lines = []
+        for key in sorted(lines_dict.keys()): # Sort by vertical position
+            row_spans = sorted(lines_dict[key], key=lambda s_item: s_item[2][0]) # Sort by x-origin
+            line_pieces = []
+            for span_idx, (text_content, span_bbox, _, is_bold) in enumerate(row_spans):
+                if span_idx > 0: # Add space if there's a visual gap
+                    prev_span_x1 = row_spans[span_idx - 1][1][2]
+                    if span_bbox[0] > prev_span_x1 + 1.5: # Tolerance for space
+                        line_pieces.append(" ")
+                line_pieces.append(f"<b>{text_content}</b>" if is_bold else text_content)
+
+            span_text_lines.append("".join(line_pieces))
+        return "<br/>".join(span_text_lines)
+    except Exception:
+        return ""
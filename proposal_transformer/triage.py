@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Cheap per-page prefilter that decides whether the table detectors need to run at all.
+
+Narrative, terms and signature pages carry no pricing table but used to pay for camelot
+and two pdfplumber find_tables passes. triage_page reads the PyMuPDF text and vector
+drawings of a page (a few milliseconds) and looks for the signals a pricing table
+leaves: HEADERS vocabulary, dollar amounts, dates and ruling lines.
+"""
+import re
+from collections import namedtuple
+
+from proposal_transformer.extract import HEADERS
+
+PageTriage = namedtuple("PageTriage", "index likely_table header_hits money dates rulings")
+
+HEADER_KEYWORDS = sorted({re.sub(r"\s*\(.*?\)", "", h).lower() for h in HEADERS}) # "Term (Months)" -> "term"
+MONEY_RE = re.compile(r'\$\s*[\d,]+(?:\.\d{1,2})?')
+DATE_RE = re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}')
+DETECTOR_STAGES = ("camelot_lattice", "find_tables", "table_extract", "hyperlinks")
+
+
+def triage_page(page):
+    """Classifies one fitz page; likely_table errs on the side of running the detectors."""
+    text = " ".join(page.get_text("text").split()).lower()
+    rulings = sum(len(path.get("items", ())) for path in page.get_cdrawings())
+    header_hits = sum(1 for kw in HEADER_KEYWORDS if kw in text)
+    money = len(MONEY_RE.findall(text))
+    dates = len(DATE_RE.findall(text))
+    likely_table = header_hits >= 2 or (money >= 1 and rulings >= 4) or (money >= 2 and dates >= 1)
+    return PageTriage(page.number, likely_table, header_hits, money, dates, rulings)
+
+
+def estimate_saved_seconds(profile):
+    """Skipped pages times the average detector cost of the pages that were not skipped."""
+    skipped = profile["counters"].get("pages_skipped_by_triage", 0)
+    detected = profile["counters"].get("pages", 0) - skipped
+    if not skipped or detected <= 0:
+        return 0.0
+    detector_wall = sum(stage["wall"] for stage in profile["stages"] if stage["stage"] in DETECTOR_STAGES)
+    return skipped * detector_wall / detected